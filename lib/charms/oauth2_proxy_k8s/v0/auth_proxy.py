@@ -69,7 +69,6 @@ import re
 from dataclasses import asdict, dataclass, field
 from typing import Any, Dict, List, Mapping, Optional
 
-import jsonschema
 from ops.charm import CharmBase, RelationBrokenEvent, RelationChangedEvent, RelationCreatedEvent
 from ops.framework import EventBase, EventSource, Handle, Object, ObjectEvents
 from ops.model import Relation, TooManyRelatedAppsError
@@ -82,7 +81,7 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 4
+LIBPATCH = 7
 
 RELATION_NAME = "auth-proxy"
 INTERFACE_NAME = "auth_proxy"
@@ -188,6 +187,9 @@ def _validate_data(data: Dict, schema: Dict) -> None:
 
     Will raise DataValidationError if the data is not valid, else return None.
     """
+    # jsonschema is only needed when relation data is validated
+    import jsonschema
+
     try:
         jsonschema.validate(instance=data, schema=schema)
     except jsonschema.ValidationError as e:
@@ -228,6 +230,25 @@ class AuthProxyConfig:
         return {k: v for k, v in asdict(self).items() if v is not None}
 
 
+@dataclass
+class AuthProxyRelationsData:
+    """Helper class containing the merged auth-proxy configuration of all related charms."""
+
+    app_names: List[str] = field(default_factory=lambda: [])
+    allowed_endpoints: List[str] = field(default_factory=lambda: [])
+    headers: List[str] = field(default_factory=lambda: [])
+    authenticated_emails: List[str] = field(default_factory=lambda: [])
+    authenticated_email_domains: List[str] = field(default_factory=lambda: [])
+
+
+MERGED_RELATION_KEYS = [
+    "allowed_endpoints",
+    "headers",
+    "authenticated_emails",
+    "authenticated_email_domains",
+]
+
+
 class AuthProxyConfigChangedEvent(EventBase):
     """Event to notify the Provider charm that the auth proxy config has changed."""
 
@@ -421,7 +442,7 @@ class AuthProxyProvider(AuthProxyRelation):
         ]
 
     def get_relations_data(self, key: str) -> Optional[List[str]]:
-        """Returns a list of key values from all auth-proxy relations or None.
+        """Returns a sorted list of unique key values from all auth-proxy relations or None.
         """
         if not self._charm.model.relations[self._relation_name]:
             return None
@@ -432,7 +453,39 @@ class AuthProxyProvider(AuthProxyRelation):
             if normalized := self._normalize_relation_value(key, data.get(key)):
                 relations_data.update(normalized)
 
-        return list(relations_data)
+        return sorted(relations_data)
+
+    def get_merged_relations_data(self) -> AuthProxyRelationsData:
+        """Returns the merged config of all auth-proxy relations, decoding each databag once.
+
+        The merged values are de-duplicated and sorted so that the result does not depend
+        on the order of the relations or of the values in each databag.
+        """
+        app_names: List[str] = []
+        merged: Dict[str, set[str]] = {key: set() for key in MERGED_RELATION_KEYS}
+
+        for relation in self._charm.model.relations.get(self._relation_name, []):
+            if relation.app is None:
+                continue
+
+            raw_data = relation.data[relation.app]
+            app_names.append(raw_data.get("app_name", relation.app.name))
+            if not raw_data:
+                continue
+
+            try:
+                data = _load_data(raw_data)
+            except DataValidationError:
+                continue
+
+            for key, values in merged.items():
+                if normalized := self._normalize_relation_value(key, data.get(key)):
+                    values.update(normalized)
+
+        return AuthProxyRelationsData(
+            app_names=app_names,
+            **{key: sorted(values) for key, values in merged.items()},
+        )
 
 class InvalidAuthProxyConfigEvent(EventBase):
     """Event to notify the charm that the auth proxy configuration is invalid."""
@@ -54,7 +54,6 @@ import logging
 from dataclasses import asdict, dataclass, field
 from typing import Dict, List, Mapping, Optional
 
-import jsonschema
 from ops.charm import CharmBase, RelationBrokenEvent, RelationChangedEvent, RelationCreatedEvent
 from ops.framework import EventBase, EventSource, Handle, Object, ObjectEvents
 from ops.model import Relation, TooManyRelatedAppsError
@@ -67,7 +66,7 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 2
+LIBPATCH = 3
 
 RELATION_NAME = "forward-auth"
 INTERFACE_NAME = "forward_auth"
@@ -161,6 +160,9 @@ def _validate_data(data: Dict, schema: Dict) -> None:
 
     Will raise DataValidationError if the data is not valid, else return None.
     """
+    # jsonschema is only needed when relation data is validated
+    import jsonschema
+
     try:
         jsonschema.validate(instance=data, schema=schema)
     except jsonschema.ValidationError as e:
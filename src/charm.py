@@ -4,14 +4,18 @@
 
 """Charm the application."""
 
+import json
 import logging
+import time
+from dataclasses import replace
+from typing import Optional
 
 from charms.certificate_transfer_interface.v1.certificate_transfer import (
     CertificatesAvailableEvent,
     CertificatesRemovedEvent,
 )
 from charms.hydra.v0.oauth import ClientConfig as OauthClientConfig
-from charms.hydra.v0.oauth import OAuthInfoChangedEvent, OAuthRequirer
+from charms.hydra.v0.oauth import OAuthInfoChangedEvent
 from charms.oauth2_proxy_k8s.v0.auth_proxy import (
     AuthProxyConfigChangedEvent,
     AuthProxyConfigRemovedEvent,
@@ -30,52 +34,70 @@ from charms.observability_libs.v0.kubernetes_compute_resources_patch import (
     ResourceRequirements,
     adjust_resource_requirements,
 )
+from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
 from charms.traefik_k8s.v2.ingress import (
     IngressPerAppReadyEvent,
     IngressPerAppRequirer,
     IngressPerAppRevokedEvent,
 )
-from ops import main, pebble
+from ops import main
 from ops.charm import (
     ActionEvent,
     CharmBase,
     ConfigChangedEvent,
     HookEvent,
+    PebbleCheckRecoveredEvent,
+    PebbleCustomNoticeEvent,
     PebbleReadyEvent,
+    RelationChangedEvent,
+    RelationEvent,
+    SecretChangedEvent,
     UpdateStatusEvent,
 )
+from ops.framework import StoredState
 from ops.model import (
     ActiveStatus,
     BlockedStatus,
     MaintenanceStatus,
     ModelError,
+    StatusBase,
     WaitingStatus,
 )
-from ops.pebble import CheckStatus, Layer
+from ops.pebble import Layer
 
 from cli import CommandLine
 from configs import CharmConfig
 from constants import (
-    ACCESS_LIST_EMAILS_PATH,
     AUTH_PROXY_RELATION_NAME,
+    COOKIE_SECRET_KEY,
     FORWARD_AUTH_RELATION_NAME,
+    METRICS_INTEGRATION_NAME,
     OAUTH2_PROXY_API_PORT,
+    OAUTH2_PROXY_METRICS_PORT,
     OAUTH_GRANT_TYPES,
     OAUTH_SCOPES,
     PEBBLE_READY_CHECK_NAME,
+    PEER_INTEGRATION_NAME,
+    RECONCILE_NOTICE_KEY,
+    REDIS_INTEGRATION_NAME,
+    STARTUP_NOTICE_KEY,
+    STARTUP_WAKE_UP_TIMEOUT,
     WORKLOAD_CONTAINER,
     WORKLOAD_SERVICE,
 )
 from exceptions import PebbleServiceError
 from integrations import (
-    AuthProxyIntegrationData,
-    IngressIntegrationData,
-    OAuthIntegrationData,
+    CachedOAuthRequirer,
+    IntegrationSnapshot,
     PeerData,
+    RestartLock,
+    SecretCache,
     TrustedCertificatesTransferIntegration,
 )
-from log import log_event_handler
-from services import PebbleService
+from log import HookStats, ReconcileCounters, log_event_handler, timed_span
+from profiler import DispatchProfiler
+from reconcile import DesiredState, Fingerprint
+from services import PebbleService, PlanResult, check_passed_since
 
 logger = logging.getLogger(__name__)
 
@@ -83,14 +105,24 @@ logger = logging.getLogger(__name__)
 class Oauth2ProxyK8sOperatorCharm(CharmBase):
     """Charmed Oauth2 Proxy."""
 
+    _stored = StoredState()
+
     def __init__(self, *args) -> None:
         super().__init__(*args)
+        self.profiler = DispatchProfiler(self, self.config.get("profile_dispatches", 0))
+        self._stored.set_default(
+            fingerprint={}, last_changed_steps=[], reconcile_requested=False, startup={}
+        )
+        self.hook_stats = HookStats(self)
+        self.reconcile_counters = ReconcileCounters(self)
 
         self._container = self.unit.get_container(WORKLOAD_CONTAINER)
         self._pebble_service = PebbleService(self.unit)
         self.cli = CommandLine(self._container)
         self.peer_data = PeerData(self.model)
+        self.restart_lock = RestartLock(self)
         self.charm_config = CharmConfig(self.config)
+        self._snapshot: Optional[IntegrationSnapshot] = None
 
         self.ingress_requirer = IngressPerAppRequirer(
             self,
@@ -101,6 +133,12 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
         )
 
         self.trusted_cert_transfer = TrustedCertificatesTransferIntegration(self)
+        self.metrics_endpoint = MetricsEndpointProvider(
+            self,
+            relation_name=METRICS_INTEGRATION_NAME,
+            jobs=[{"static_configs": [{"targets": [f"*:{OAUTH2_PROXY_METRICS_PORT}"]}]}],
+            refresh_event=[self.on[WORKLOAD_CONTAINER].pebble_ready, self.on.config_changed],
+        )
 
         self.resources_patch = KubernetesComputeResourcesPatch(
             self,
@@ -108,7 +146,8 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
             resource_reqs_func=self._resource_reqs_from_config,
         )
 
-        self.oauth = OAuthRequirer(self, self._oauth_client_config)
+        self.secret_cache = SecretCache(self)
+        self.oauth = CachedOAuthRequirer(self, self.secret_cache, self._oauth_client_config)
 
         self.auth_proxy = AuthProxyProvider(self, relation_name=AUTH_PROXY_RELATION_NAME)
         self.forward_auth = ForwardAuthProvider(
@@ -117,14 +156,49 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
             forward_auth_config=self._forward_auth_config,
         )
         self.framework.observe(self.on[WORKLOAD_CONTAINER].pebble_ready, self._on_pebble_ready)
+        self.framework.observe(
+            self.on[WORKLOAD_CONTAINER].pebble_custom_notice, self._on_pebble_custom_notice
+        )
+        self.framework.observe(
+            self.on[WORKLOAD_CONTAINER].pebble_check_recovered, self._on_pebble_check_recovered
+        )
         self.framework.observe(self.on.config_changed, self._on_config_changed)
 
         self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.on.leader_elected, self._on_restart_lock_changed)
+        self.framework.observe(self.on.secret_changed, self._on_secret_changed)
 
         # oauth integration observations
         self.framework.observe(self.oauth.on.oauth_info_changed, self._on_oauth_info_changed)
         self.framework.observe(self.oauth.on.oauth_info_removed, self._on_oauth_info_changed)
 
+        # metrics-endpoint integration observations
+        self.framework.observe(
+            self.on[METRICS_INTEGRATION_NAME].relation_joined, self._on_metrics_endpoint_changed
+        )
+        self.framework.observe(
+            self.on[METRICS_INTEGRATION_NAME].relation_broken, self._on_metrics_endpoint_changed
+        )
+
+        # redis integration observations
+        self.framework.observe(
+            self.on[REDIS_INTEGRATION_NAME].relation_changed, self._on_redis_changed
+        )
+        self.framework.observe(
+            self.on[REDIS_INTEGRATION_NAME].relation_departed, self._on_redis_changed
+        )
+        self.framework.observe(
+            self.on[REDIS_INTEGRATION_NAME].relation_broken, self._on_redis_changed
+        )
+
+        # peer integration observations
+        self.framework.observe(
+            self.on[PEER_INTEGRATION_NAME].relation_changed, self._on_peer_relation_changed
+        )
+        self.framework.observe(
+            self.on[PEER_INTEGRATION_NAME].relation_departed, self._on_restart_lock_changed
+        )
+
         # ingress integration observations
         self.framework.observe(self.ingress_requirer.on.ready, self._on_ingress_ready)
         self.framework.observe(self.ingress_requirer.on.revoked, self._on_ingress_revoked)
@@ -167,33 +241,61 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
             self.on.get_extra_jwt_issuers_action,
             self._on_get_extra_jwt_issuers,
         )
+        self.framework.observe(self.on.hook_stats_action, self._on_hook_stats)
+        self.framework.observe(self.on.dump_profile_action, self._on_dump_profile)
+        self.framework.observe(self.on.reconcile_stats_action, self._on_reconcile_stats)
+
+    @property
+    def _integration_snapshot(self) -> IntegrationSnapshot:
+        if self._snapshot is None:
+            self._snapshot = IntegrationSnapshot(self)
+        return self._snapshot
+
+    def _invalidate_integration_snapshot(self) -> None:
+        """Drop the integration snapshot after the charm writes relation data."""
+        self._snapshot = None
+
+    def _update_oauth_client_config(self) -> None:
+        with timed_span("write-relation-data"):
+            self.oauth.update_client_config(client_config=self._oauth_client_config)
+        self.reconcile_counters.increment("oauth-writes")
+        self._invalidate_integration_snapshot()
+
+    def _update_forward_auth_config(self) -> None:
+        with timed_span("write-relation-data"):
+            self.forward_auth.update_forward_auth_config(self._forward_auth_config)
+        # Only the leader writes the application data, the other units skip the update
+        if self.unit.is_leader():
+            self.reconcile_counters.increment("forward-auth-writes")
+        self._invalidate_integration_snapshot()
 
     @property
     def _pebble_layer(self) -> Layer:
-        ingress_data = IngressIntegrationData.load(self.ingress_requirer)
-        oauth_data = OAuthIntegrationData.load(self.oauth)
-        auth_proxy_data = AuthProxyIntegrationData.load(self.auth_proxy)
-
-        return self._pebble_service.render_pebble_layer(
-            self.charm_config,
-            ingress_data,
-            oauth_data,
-            auth_proxy_data,
-            self.peer_data,
-        )
+        snapshot = self._integration_snapshot
+        with timed_span("render-layer"):
+            return self._pebble_service.render_pebble_layer(
+                self.charm_config,
+                snapshot.ingress,
+                snapshot.oauth,
+                snapshot.auth_proxy,
+                snapshot.redis,
+                snapshot.metrics,
+                self.peer_data,
+                layer_options=self.charm_config.to_pebble_layer_options(),
+            )
 
     @property
     def _oauth_client_config(self) -> OauthClientConfig:
-        ingress_data = IngressIntegrationData.load(self.ingress_requirer)
+        ingress_data = self._integration_snapshot.ingress
         return OauthClientConfig(
-            redirect_uri=str(ingress_data.url / "oauth2" / "callback"),
+            redirect_uri=ingress_data.redirect_url,
             scope=OAUTH_SCOPES,
             grant_types=OAUTH_GRANT_TYPES,
         )
 
     @property
     def _forward_auth_config(self) -> ForwardAuthConfig:
-        auth_proxy_data = AuthProxyIntegrationData.load(self.auth_proxy)
+        auth_proxy_data = self._integration_snapshot.auth_proxy
         oauth2_proxy_url = (
             f"http://{self.app.name}.{self.model.name}.svc.cluster.local:{OAUTH2_PROXY_API_PORT}"
         )
@@ -214,22 +316,42 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
             return False
         return service.is_running()
 
-    def _validate_pebble_plan(self) -> bool:
-        """Validate pebble plan."""
-        try:
-            plan = self._container.get_plan().to_dict()
-            return bool(plan["services"][WORKLOAD_SERVICE]["on-check-failure"])
-        except (KeyError, pebble.ConnectionError):
-            return False
+    def _desired_state(self) -> DesiredState:
+        return DesiredState(
+            layer=self._pebble_layer,
+            files=self._integration_snapshot.auth_proxy.to_config_files(),
+            ca_certs=self.trusted_cert_transfer.ca_bundle,
+        )
 
     @log_event_handler(logger)
     def _on_pebble_ready(self, event: PebbleReadyEvent) -> None:
-        self.model.unit.open_port(protocol="tcp", port=OAUTH2_PROXY_API_PORT)
+        self._update_ports()
+        # A (re)started workload container comes with a fresh filesystem and plan
+        self._stored.fingerprint = {}
         self._holistic_handler(event)
 
         if version := self.cli.get_oauth2_proxy_service_version():
             self.unit.set_workload_version(version)
 
+    @log_event_handler(logger)
+    def _on_pebble_custom_notice(self, event: PebbleCustomNoticeEvent) -> None:
+        if event.notice.key in (RECONCILE_NOTICE_KEY, STARTUP_NOTICE_KEY):
+            self._holistic_handler(event)
+
+    @log_event_handler(logger)
+    def _on_redis_changed(self, event: RelationEvent) -> None:
+        self._holistic_handler(event)
+
+    @log_event_handler(logger)
+    def _on_peer_relation_changed(self, event: RelationChangedEvent) -> None:
+        """Pick up the cookie secret and the restart grants shared by the leader."""
+        self.restart_lock.grant()
+        self._holistic_handler(event)
+
+    @log_event_handler(logger)
+    def _on_restart_lock_changed(self, event: HookEvent) -> None:
+        self.restart_lock.grant()
+
     @log_event_handler(logger)
     def _on_ingress_ready(self, event: IngressPerAppReadyEvent) -> None:
         """Handle ingress ready event and update oauth relation data.
@@ -240,7 +362,7 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
         self._holistic_handler(event)
         if self.unit.is_leader():
             logger.info(f"This app's ingress URL: {event.url}")
-            self.oauth.update_client_config(client_config=self._oauth_client_config)
+            self._update_oauth_client_config()
 
     @log_event_handler(logger)
     def _on_ingress_revoked(self, event: IngressPerAppRevokedEvent) -> None:
@@ -253,7 +375,7 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
 
         if self.unit.is_leader():
             logger.info("This app no longer has ingress")
-            self.oauth.update_client_config(client_config=self._oauth_client_config)
+            self._update_oauth_client_config()
 
     @log_event_handler(logger)
     def _on_trusted_certificates_available(self, event: CertificatesAvailableEvent) -> None:
@@ -267,29 +389,53 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
     def _on_config_changed(self, event: ConfigChangedEvent) -> None:
         """Handle config-changed event."""
         self._holistic_handler(event)
+        self._update_ports()
+
+    @log_event_handler(logger)
+    def _on_metrics_endpoint_changed(self, event: RelationEvent) -> None:
+        self._holistic_handler(event)
+        self._update_ports()
 
     @log_event_handler(logger)
     def _on_update_status(self, event: UpdateStatusEvent) -> None:
         """Handle `update-status` events.
 
+        Only reconciles when the inputs or the workload drifted from the applied state.
+
         Args:
             event: The `update-status` event triggered at intervals.
         """
-        # TODO: Evaluate if this is needed
-        valid_pebble_plan = self._validate_pebble_plan()
-        if not valid_pebble_plan:
+        if self._stored.reconcile_requested or not self._container.can_connect():
             self._holistic_handler(event)
             return
 
-        check = self._container.get_check(PEBBLE_READY_CHECK_NAME)
-        if check.status != CheckStatus.UP:
+        desired_state = self._desired_state()
+        applied = Fingerprint.from_dict(self._stored.fingerprint)
+        if desired_state.fingerprint().diff(applied):
+            self._holistic_handler(event)
+            return
+
+        probe = self._pebble_service.probe(desired_state.layer)
+        if probe.drifted:
+            logger.info("The workload drifted from the applied pebble layer")
+            # Forget the applied layer so that the reconcile replans the service
+            self._stored.fingerprint = replace(applied, layer="").to_dict()
+            self._holistic_handler(event)
+            return
+
+        if not probe.check_up:
             self.unit.status = MaintenanceStatus("Status check: DOWN")
             return
 
         if isinstance(self.unit.status, BlockedStatus):
             return
 
-        self._holistic_handler(event)
+        self._update_startup_status()
+
+    @log_event_handler(logger)
+    def _on_pebble_check_recovered(self, event: PebbleCheckRecoveredEvent) -> None:
+        if event.info.name == PEBBLE_READY_CHECK_NAME and self._stored.startup:
+            self._update_startup_status()
 
     @log_event_handler(logger)
     def _on_oauth_info_changed(self, event: OAuthInfoChangedEvent) -> None:
@@ -300,6 +446,15 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
         """
         self._holistic_handler(event)
 
+    @log_event_handler(logger)
+    def _on_secret_changed(self, event: SecretChangedEvent) -> None:
+        """Track the latest revision of the oauth client secret."""
+        if not self.secret_cache.refresh(event.secret):
+            return
+
+        self._invalidate_integration_snapshot()
+        self._holistic_handler(event)
+
     @log_event_handler(logger)
     def _on_invalid_forward_auth_config(self, event: InvalidForwardAuthConfigEvent) -> None:
         logger.info(
@@ -322,19 +477,38 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
     def _on_auth_proxy_config_changed(self, event: AuthProxyConfigChangedEvent) -> None:
         if not self._oauth2_proxy_service_is_running:
             self.unit.status = WaitingStatus("Waiting for OAuth2 Proxy service")
-            event.defer()
+            self._request_reconcile()
             return
 
         self._holistic_handler(event)
 
         logger.info("Auth-proxy config has changed. Forward-auth relation will be updated")
-        self.forward_auth.update_forward_auth_config(self._forward_auth_config)
+        self._update_forward_auth_config()
 
     @log_event_handler(logger)
     def _remove_auth_proxy_configuration(self, event: AuthProxyConfigRemovedEvent) -> None:
         """Remove the auth-proxy-related config for a given relation."""
         self._holistic_handler(event)
-        self.forward_auth.update_forward_auth_config(self._forward_auth_config)
+        self._update_forward_auth_config()
+
+    def _unmet_prerequisite_status(self) -> Optional[StatusBase]:
+        if invalid_config := self.charm_config.validate():
+            logger.error(f"Invalid charm config: {invalid_config}")
+            return BlockedStatus(f"Invalid config: {invalid_config}")
+
+        if self.charm_config["enable_jwt_bearer_tokens"] and not self.oauth.is_client_created():
+            logger.warning(
+                "The config `enable_jwt_bearer_tokens` is enabled, please connect the `oauth` integration."
+            )
+            return BlockedStatus(
+                "Please connect the `oauth` integration or disable the `enable_jwt_bearer_tokens` config."
+            )
+
+        if self.peer_data[COOKIE_SECRET_KEY] is None:
+            # All units must share the cookie secret to decrypt each other's sessions
+            return WaitingStatus("Waiting for the leader to share the cookie secret")
+
+        return None
 
     @log_event_handler(logger)
     def _holistic_handler(self, event: HookEvent) -> None:
@@ -344,39 +518,133 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
             event: The event triggered when the application needs to be updated.
         """
         if not self._container.can_connect():
-            event.defer()
-            logger.info("Cannot connect to OAuth2-Proxy container. Deferring the event.")
+            self._request_reconcile()
+            logger.info("Cannot connect to OAuth2-Proxy container. Requesting a reconcile.")
             self.unit.status = WaitingStatus("Waiting to connect to OAuth2-Proxy container")
             return
 
-        if self.charm_config["enable_jwt_bearer_tokens"] and not self.oauth.is_client_created():
-            logger.warning(
-                "The config `enable_jwt_bearer_tokens` is enabled, please connect the `oauth` integration."
-            )
-            self.unit.status = BlockedStatus(
-                "Please connect the `oauth` integration or disable the `enable_jwt_bearer_tokens` config."
-            )
+        if unmet_status := self._unmet_prerequisite_status():
+            self._stop_startup_wake_ups()
+            self.unit.status = unmet_status
             return
 
+        desired_state = self._desired_state()
+        fingerprint = desired_state.fingerprint()
+        applied = Fingerprint.from_dict(self._stored.fingerprint)
+
+        if not (changed_steps := fingerprint.diff(applied)):
+            logger.info("The desired state is unchanged, skipping the reconcile")
+            self._update_startup_status()
+            self._complete_reconcile_request()
+            return
+
+        logger.info(f"Reconciling the changed steps: {', '.join(changed_steps)}")
+        self._stored.last_changed_steps = changed_steps
         self.unit.status = MaintenanceStatus("Configuring the container")
 
-        auth_proxy_data = AuthProxyIntegrationData.load(self.auth_proxy)
-        if emails := auth_proxy_data.authenticated_emails:
-            users = "\n".join(emails)
-            self._container.push(ACCESS_LIST_EMAILS_PATH, users, make_dirs=True)
+        if "files" in changed_steps:
+            with timed_span("push-access-list"):
+                for file in desired_state.files:
+                    self._pebble_service.push_file(file.path, file.chunks())
+            self.reconcile_counters.increment("access-list-pushes")
+
+        if "ca_certs" in changed_steps:
+            with timed_span("rebuild-ca-bundle"):
+                self.trusted_cert_transfer.update_trusted_ca_certs()
+            self.reconcile_counters.increment("ca-bundle-rebuilds")
+
+        if "layer" in changed_steps and (status := self._apply_layer(desired_state.layer)):
+            # Keep the previous layer digest so that the next hook retries the replan
+            fingerprint = replace(fingerprint, layer=applied.layer)
+            self._stored.fingerprint = fingerprint.to_dict()
+            self._stop_startup_wake_ups()
+            self.unit.status = status
+            return
 
-        self.trusted_cert_transfer.update_trusted_ca_certs()
+        self._stored.fingerprint = fingerprint.to_dict()
+        self._update_startup_status()
+        self._complete_reconcile_request()
 
+    def _apply_layer(self, layer: Layer) -> Optional[StatusBase]:
+        """Apply the pebble layer, returning the status to report if it was not applied."""
         try:
-            self._pebble_service.plan(self._pebble_layer)
+            with timed_span("replan"):
+                plan_result = self._pebble_service.plan(
+                    layer, self.charm_config["restart_drain_period"], self.restart_lock.acquire
+                )
         except PebbleServiceError:
-            self.unit.status = BlockedStatus(
-                "Failed to replan the pebble service, please consult the logs"
-            )
+            return BlockedStatus("Failed to replan the pebble service, please consult the logs")
+
+        if plan_result == PlanResult.DEFERRED:
+            return WaitingStatus("Waiting for the restart lock")
+
+        logger.info(f"The pebble layer was applied: {plan_result.value}")
+        if plan_result == PlanResult.RESTARTED:
+            self.reconcile_counters.increment("service-restarts")
+            # A replaced check starts counting afresh, so the baseline is read afterwards
+            ready_check = self._pebble_service.ready_check()
+            started_at = time.time()
+            self._stored.startup = {
+                "started_at": started_at,
+                "successes": (ready_check and ready_check.successes) or 0,
+                "wake_up_deadline": started_at + STARTUP_WAKE_UP_TIMEOUT,
+            }
+            self._pebble_service.start_startup_check()
+
+        return None
+
+    def _update_startup_status(self) -> None:
+        """Report the unit active once the ready check passed since the last restart.
+
+        The charm does not wait for the workload in the hook. The startup check wakes
+        the charm up at every check period until the startup completes or its deadline
+        passes, with the ready check recovery and update-status as fallbacks.
+        """
+        if not (startup := self._stored.startup):
+            self.restart_lock.release()
+            self.unit.status = ActiveStatus()
             return
 
+        if not check_passed_since(self._pebble_service.ready_check(), startup["successes"]):
+            if (deadline := startup.get("wake_up_deadline")) and time.time() > deadline:
+                logger.warning(
+                    "OAuth2 Proxy is still not ready, leaving the startup to update-status"
+                )
+                self._stop_startup_wake_ups()
+            self.unit.status = MaintenanceStatus("Waiting for OAuth2 Proxy to be ready")
+            return
+
+        self._stop_startup_wake_ups()
+        self._stored.startup = {}
+        self.reconcile_counters.set_gauge("startup-seconds", time.time() - startup["started_at"])
+        self.restart_lock.release()
         self.unit.status = ActiveStatus()
 
+    def _stop_startup_wake_ups(self) -> None:
+        """Stop the startup check of a pending startup, once."""
+        if (startup := self._stored.startup) and startup.get("wake_up_deadline"):
+            self._pebble_service.stop_startup_check()
+            self._stored.startup = {**startup, "wake_up_deadline": None}
+
+    def _update_ports(self) -> None:
+        ports = [OAUTH2_PROXY_API_PORT]
+        if self._integration_snapshot.metrics.enabled:
+            ports.append(OAUTH2_PROXY_METRICS_PORT)
+        self.unit.set_ports(*ports)
+
+    def _request_reconcile(self) -> None:
+        """Coalesce the pending work into a single reconcile instead of deferring events."""
+        self._stored.reconcile_requested = True
+        self.reconcile_counters.increment("reconcile-requests")
+
+    def _complete_reconcile_request(self) -> None:
+        """Finish the work coalesced while the workload was down, once a reconcile succeeded."""
+        if not self._stored.reconcile_requested or not self._oauth2_proxy_service_is_running:
+            return
+
+        self._stored.reconcile_requested = False
+        self._update_forward_auth_config()
+
     def _on_resource_patch_failed(self, event: K8sResourcePatchFailedEvent) -> None:
         logger.error(f"Failed to patch resource constraints: {event.message}")
         self.unit.status = BlockedStatus(event.message)
@@ -395,22 +663,31 @@ class Oauth2ProxyK8sOperatorCharm(CharmBase):
         if not self.charm_config["enable_jwt_bearer_tokens"]:
             return event.fail("`enable_jwt_bearer_tokens` is not enabled")
 
-        issuer_url = self._pebble_layer.services[WORKLOAD_SERVICE].environment.get(
-            "OAUTH2_PROXY_OIDC_ISSUER_URL"
-        )
-        if not issuer_url:
+        env_vars = self._pebble_layer.services[WORKLOAD_SERVICE].environment
+        if not (issuer_url := env_vars.get("OAUTH2_PROXY_OIDC_ISSUER_URL")):
             return event.fail("The issuer URL is not set")
 
-        client_id = self._pebble_layer.services[WORKLOAD_SERVICE].environment.get(
-            "OAUTH2_PROXY_CLIENT_ID"
-        )
-        if not client_id:
+        if not (client_id := env_vars.get("OAUTH2_PROXY_CLIENT_ID")):
             return event.fail("The client ID is not set")
 
         return event.set_results({
             "extra-jwt-issuers": [{"oidc-issuer-url": issuer_url, "audience": client_id}]
         })
 
+    def _on_hook_stats(self, event: ActionEvent) -> None:
+        event.set_results({"hook-stats": json.dumps(self.hook_stats.summary(), sort_keys=True)})
+
+    def _on_dump_profile(self, event: ActionEvent) -> None:
+        if (report := self.profiler.read_report()) is None:
+            return event.fail(
+                "No profile was captured. Set the `profile_dispatches` config to profile dispatches"
+            )
+
+        event.set_results({"profile": report})
+
+    def _on_reconcile_stats(self, event: ActionEvent) -> None:
+        event.set_results(self.reconcile_counters.stats())
+
 
 if __name__ == "__main__":
     main(Oauth2ProxyK8sOperatorCharm)
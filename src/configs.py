@@ -1,14 +1,36 @@
 # Copyright 2025 Canonical Ltd.
 # See LICENSE file for licensing details.
 
-from typing import Any, Mapping, TypeAlias
+import logging
+import math
+import re
+from typing import Any, Mapping, Optional, TypeAlias
 
+from lightkube.utils.quantity import parse_quantity
 from ops import ConfigData
 
+from constants import MAX_RESTART_DRAIN_PERIOD, REDIS_MODES
 from env_vars import EnvVars
+from services import PebbleLayerOptions, parse_duration
+
+logger = logging.getLogger(__name__)
 
 ServiceConfigs: TypeAlias = Mapping[str, Any]
 
+# The byte count syntax of the Go runtime's GOMEMLIMIT
+GOMEMLIMIT_REGEX = re.compile(r"off|\d+(?:B|KiB|MiB|GiB|TiB)?")
+
+
+def _parse_quantity(key: str, value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+
+    try:
+        return float(parse_quantity(value))
+    except ValueError:
+        logger.warning(f"Ignoring the invalid `{key}` config: {value}")
+        return None
+
 
 class CharmConfig:
     """A class representing the data source of charm configurations."""
@@ -19,6 +41,49 @@ class CharmConfig:
     def __getitem__(self, key: str) -> Any:
         return self._config.get(key)
 
+    def validate(self) -> Optional[str]:
+        """Return the reason the configuration is invalid, or None if it is valid."""
+        if not 0 <= self._config["restart_drain_period"] <= MAX_RESTART_DRAIN_PERIOD:
+            return f"`restart_drain_period` must be between 0 and {MAX_RESTART_DRAIN_PERIOD}"
+
+        if self._config["restart_batch_size"] < 1:
+            return "`restart_batch_size` must be at least 1"
+
+        if self._config["redis_mode"] not in REDIS_MODES:
+            return f"`redis_mode` must be one of {', '.join(REDIS_MODES)}"
+
+        # Pebble rejects a layer with invalid check durations when it is added
+        if not (period := parse_duration(self._config["check_period"])):
+            return "`check_period` must be a positive duration"
+
+        if not (timeout := parse_duration(self._config["check_timeout"])) or timeout >= period:
+            return "`check_timeout` must be a positive duration shorter than `check_period`"
+
+        if self._config["check_threshold"] < 1:
+            return "`check_threshold` must be at least 1"
+
+        if (kill_delay := self._config["kill_delay"]) and parse_duration(kill_delay) is None:
+            return "`kill_delay` must be a duration"
+
+        return self._validate_go_runtime()
+
+    def _validate_go_runtime(self) -> Optional[str]:
+        # The Go runtime aborts at startup on a malformed value
+        if (gomaxprocs := self._config.get("gomaxprocs")) and not (
+            gomaxprocs.isdigit() and int(gomaxprocs) > 0
+        ):
+            return "`gomaxprocs` must be a positive integer"
+
+        if (gomemlimit := self._config.get("gomemlimit")) and not GOMEMLIMIT_REGEX.fullmatch(
+            gomemlimit
+        ):
+            return "`gomemlimit` must be a byte count, e.g. 900MiB"
+
+        if not 0 < self._config["gomemlimit_ratio"] <= 1:
+            return "`gomemlimit_ratio` must be greater than 0 and at most 1"
+
+        return None
+
     def to_env_vars(self) -> EnvVars:
         env_vars = {
             "OAUTH2_PROXY_SSL_INSECURE_SKIP_VERIFY": "true" if self._config["dev"] else "false"
@@ -32,4 +97,31 @@ class CharmConfig:
         if self._config["set_authorization_header"]:
             env_vars["OAUTH2_PROXY_SET_AUTHORIZATION_HEADER"] = "true"
 
+        env_vars.update(self._go_runtime_env_vars())
+
+        return env_vars
+
+    def to_pebble_layer_options(self) -> PebbleLayerOptions:
+        return PebbleLayerOptions(
+            period=self._config["check_period"],
+            timeout=self._config["check_timeout"],
+            threshold=self._config["check_threshold"],
+            restart_on_liveness_failure=self._config["restart_on_liveness_failure"],
+            kill_delay=self._config["kill_delay"],
+        )
+
+    def _go_runtime_env_vars(self) -> EnvVars:
+        """Size the Go runtime after the container's resource limits."""
+        env_vars = {}
+
+        if gomaxprocs := self._config.get("gomaxprocs"):
+            env_vars["GOMAXPROCS"] = gomaxprocs
+        elif cpu := _parse_quantity("cpu", self._config.get("cpu")):
+            env_vars["GOMAXPROCS"] = str(max(1, math.floor(cpu)))
+
+        if gomemlimit := self._config.get("gomemlimit"):
+            env_vars["GOMEMLIMIT"] = gomemlimit
+        elif memory := _parse_quantity("memory", self._config.get("memory")):
+            env_vars["GOMEMLIMIT"] = str(int(memory * self._config["gomemlimit_ratio"]))
+
         return env_vars
@@ -7,13 +7,26 @@ from pathlib import Path
 
 # Charm constants
 PEBBLE_READY_CHECK_NAME = "ready"
+PEBBLE_LIVENESS_CHECK_NAME = "alive"
+# Custom pebble notice to trigger a reconcile by hand, e.g. `/charm/bin/pebble notify <key>`
+RECONCILE_NOTICE_KEY = "canonical.com/oauth2-proxy/reconcile"
+# Check raising a custom pebble notice at every run, waking the charm up during a startup
+PEBBLE_STARTUP_CHECK_NAME = "startup"
+STARTUP_NOTICE_KEY = "canonical.com/oauth2-proxy/startup"
+# Seconds the startup check keeps waking the charm up before update-status takes over
+STARTUP_WAKE_UP_TIMEOUT = 300
+# The drain runs within a hook, so it is capped to keep the hook short
+MAX_RESTART_DRAIN_PERIOD = 60
 
 # Application constants
 WORKLOAD_CONTAINER = "oauth2-proxy"
 WORKLOAD_SERVICE = "oauth2-proxy"
 OAUTH2_PROXY_API_PORT = 4180
+OAUTH2_PROXY_METRICS_PORT = 44180
 ACCESS_LIST_EMAILS_PATH = "/etc/config/oauth2-proxy/access_list.cfg"
 COOKIE_SECRET_KEY = "cookies_key"
+RESTART_REQUEST_KEY = "restart_requested"
+RESTART_GRANTS_KEY = "restart_grants"
 HTTP_PROXY = "JUJU_CHARM_HTTP_PROXY"
 HTTPS_PROXY = "JUJU_CHARM_HTTPS_PROXY"
 NO_PROXY = "JUJU_CHARM_NO_PROXY"
@@ -25,7 +38,11 @@ OAUTH_GRANT_TYPES = ["authorization_code", "refresh_token"]
 AUTH_PROXY_RELATION_NAME = "auth-proxy"
 FORWARD_AUTH_RELATION_NAME = "forward-auth"
 PEER_INTEGRATION_NAME = "oauth2-proxy"
+METRICS_INTEGRATION_NAME = "metrics-endpoint"
+REDIS_INTEGRATION_NAME = "redis"
+REDIS_PORT = 6379
+REDIS_SENTINEL_PORT = 26379
+REDIS_MODES = ("standalone", "sentinel", "cluster")
 
 CERTIFICATES_PATH = Path("/etc/ssl/certs")
 CERTIFICATES_FILE = Path(CERTIFICATES_PATH / "ca-certificates.crt")
-LOCAL_CA_BUNDLE_PATH = Path("/usr/local/share/ca-certificates/ca-certificates.crt")
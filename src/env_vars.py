@@ -3,7 +3,7 @@
 
 from typing import Mapping, Protocol, TypeAlias, Union
 
-from constants import OAUTH2_PROXY_API_PORT
+from constants import ACCESS_LIST_EMAILS_PATH, OAUTH2_PROXY_API_PORT
 
 EnvVars: TypeAlias = Mapping[str, Union[str, bool, list]]
 
@@ -16,6 +16,8 @@ DEFAULT_CONTAINER_ENV = {
     "OAUTH2_PROXY_SET_XAUTHREQUEST": "true",
     "OAUTH2_PROXY_REVERSE_PROXY": "true",
     "OAUTH2_PROXY_UPSTREAMS": "static://200",
+    # Always set, so that access list changes only rewrite the file, which oauth2-proxy watches
+    "OAUTH2_PROXY_AUTHENTICATED_EMAILS_FILE": ACCESS_LIST_EMAILS_PATH,
 }
 
 
@@ -1,36 +1,80 @@
 # Copyright 2025 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import base64
+import hashlib
 import json
 import logging
+import re
 import secrets
-import subprocess
 from dataclasses import dataclass, field
-from typing import Any, List
+from functools import cache, cached_property
+from typing import Any, Dict, List, Optional, Tuple
 
 from charms.certificate_transfer_interface.v1.certificate_transfer import (
     CertificateTransferRequires,
 )
+from charms.hydra.v0.oauth import ClientConfig as OauthClientConfig
 from charms.hydra.v0.oauth import OAuthRequirer
 from charms.oauth2_proxy_k8s.v0.auth_proxy import AuthProxyProvider
 from charms.traefik_k8s.v2.ingress import IngressPerAppRequirer
-from ops import Model
+from ops import Model, Relation, Secret
 from ops.charm import CharmBase
-from yarl import URL
+from ops.framework import Object, StoredState
 
 from constants import (
     ACCESS_LIST_EMAILS_PATH,
     CERTIFICATES_FILE,
     COOKIE_SECRET_KEY,
-    LOCAL_CA_BUNDLE_PATH,
+    METRICS_INTEGRATION_NAME,
     OAUTH2_PROXY_API_PORT,
+    OAUTH2_PROXY_METRICS_PORT,
     OAUTH_SCOPES,
     PEER_INTEGRATION_NAME,
+    REDIS_INTEGRATION_NAME,
+    REDIS_PORT,
+    REDIS_SENTINEL_PORT,
+    RESTART_GRANTS_KEY,
+    RESTART_REQUEST_KEY,
 )
 from env_vars import EnvVars
+from reconcile import ConfigFile
 
 logger = logging.getLogger(__name__)
 
+PEM_CERTIFICATE_REGEX = re.compile(
+    r"-----BEGIN CERTIFICATE-----(.+?)-----END CERTIFICATE-----", re.DOTALL
+)
+
+
+@cache
+def load_system_ca_bundle() -> str:
+    """Read the charm's base system CA bundle once per process."""
+    try:
+        return CERTIFICATES_FILE.read_text()
+    except OSError as e:
+        logger.error(f"Failed to read the system CA bundle: {e}")
+        return ""
+
+
+def build_ca_bundle(*bundles: str) -> str:
+    """Concatenate the certificates of the bundles, de-duplicated by their DER fingerprint."""
+    fingerprints = set()
+    certs = []
+    for bundle in bundles:
+        for match in PEM_CERTIFICATE_REGEX.finditer(bundle):
+            try:
+                der = base64.b64decode("".join(match.group(1).split()), validate=True)
+            except ValueError:
+                logger.warning("Skipping a malformed PEM certificate")
+                continue
+
+            if (fingerprint := hashlib.sha256(der).digest()) not in fingerprints:
+                fingerprints.add(fingerprint)
+                certs.append(match.group(0))
+
+    return "\n".join(certs) + "\n" if certs else ""
+
 
 class PeerData:
     def __init__(self, model: Model) -> None:
@@ -77,6 +121,120 @@ class PeerData:
         }
 
 
+class RestartLock:
+    """Roll the workload restarts across the units through the peer integration.
+
+    Each unit requests a restart in its unit data, and the leader grants the pending
+    requests in the application data, at most `batch_size` units at a time. A unit
+    releases its grant once its workload is ready again.
+    """
+
+    def __init__(self, charm: CharmBase) -> None:
+        self._charm = charm
+        self._unit = charm.unit
+
+    def acquire(self) -> bool:
+        if not (peers := self._charm.model.get_relation(PEER_INTEGRATION_NAME)):
+            return True
+
+        peers.data[self._unit][RESTART_REQUEST_KEY] = "true"
+        self.grant()
+        return self._unit.name in self._grants(peers)
+
+    def release(self) -> None:
+        if not (peers := self._charm.model.get_relation(PEER_INTEGRATION_NAME)):
+            return
+
+        if peers.data[self._unit].pop(RESTART_REQUEST_KEY, None):
+            logger.info("Released the restart lock")
+        self.grant()
+
+    def grant(self) -> None:
+        """Grant the pending restart requests, keeping the grants of the units still restarting."""
+        if not self._unit.is_leader():
+            return
+
+        if not (peers := self._charm.model.get_relation(PEER_INTEGRATION_NAME)):
+            return
+
+        requesting = sorted(
+            unit.name
+            for unit in (self._unit, *peers.units)
+            if peers.data[unit].get(RESTART_REQUEST_KEY)
+        )
+        grants = [name for name in self._grants(peers) if name in requesting]
+        for name in requesting:
+            if len(grants) >= self._charm.charm_config["restart_batch_size"]:
+                break
+            if name not in grants:
+                grants.append(name)
+
+        if grants != self._grants(peers):
+            logger.info(f"Granted the restart lock to: {', '.join(grants) or 'none'}")
+            peers.data[self._charm.app][RESTART_GRANTS_KEY] = json.dumps(grants)
+
+    def _grants(self, peers: Relation) -> List[str]:
+        return json.loads(peers.data[self._charm.app].get(RESTART_GRANTS_KEY, "[]"))
+
+
+class SecretCache(Object):
+    """Cache the content of consumed secrets by their ID and tracked revision.
+
+    Only the secret IDs and the revisions are persisted in the unit's stored state,
+    the content is kept in memory. Observers cannot read the metadata of a secret,
+    so the revision is a local counter bumped whenever the charm refreshes the secret
+    on `secret-changed`.
+    """
+
+    _stored = StoredState()
+
+    def __init__(self, charm: CharmBase) -> None:
+        super().__init__(charm, "secret-cache")
+        self._stored.set_default(revisions={})
+        self._secrets: Dict[Tuple[str, int], Secret] = {}
+
+    def get(self, secret_id: str) -> Secret:
+        revision = self._stored.revisions.get(secret_id, 0)
+        if (secret := self._secrets.get((secret_id, revision))) is None:
+            secret = self.model.get_secret(id=secret_id)
+            self._secrets[(secret_id, revision)] = secret
+            self._stored.revisions[secret_id] = revision
+
+        return secret
+
+    def refresh(self, secret: Secret) -> bool:
+        """Track the latest revision of a cached secret.
+
+        Returns:
+            Whether the secret is cached and was refreshed.
+        """
+        if (secret_id := secret.id) not in self._stored.revisions:
+            return False
+
+        secret.get_content(refresh=True)
+        revision = self._stored.revisions[secret_id] + 1
+        self._stored.revisions[secret_id] = revision
+        self._secrets = {k: v for k, v in self._secrets.items() if k[0] != secret_id}
+        self._secrets[(secret_id, revision)] = secret
+        return True
+
+
+class CachedOAuthRequirer(OAuthRequirer):
+    """An oauth requirer reading the client secret through a `SecretCache`."""
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        secret_cache: SecretCache,
+        client_config: Optional[OauthClientConfig] = None,
+    ) -> None:
+        super().__init__(charm, client_config)
+        self._secret_cache = secret_cache
+
+    def get_client_secret(self, client_secret_id: str) -> Secret:
+        return self._secret_cache.get(client_secret_id)
+
+
 @dataclass(frozen=True, slots=True)
 class AuthProxyIntegrationData:
     """Data source from the auth-proxy integration."""
@@ -93,28 +251,24 @@ class AuthProxyIntegrationData:
         if self.allowed_endpoints:
             env_vars["OAUTH2_PROXY_SKIP_AUTH_ROUTES"] = ",".join(self.allowed_endpoints)
 
-        if self.authenticated_emails:
-            env_vars["OAUTH2_PROXY_AUTHENTICATED_EMAILS_FILE"] = ACCESS_LIST_EMAILS_PATH
-
         if self.authenticated_email_domains:
             env_vars["OAUTH2_PROXY_EMAIL_DOMAINS"] = ",".join(self.authenticated_email_domains)
 
         return env_vars
 
+    def to_config_files(self) -> List[ConfigFile]:
+        return [ConfigFile(path=ACCESS_LIST_EMAILS_PATH, lines=self.authenticated_emails)]
+
     @classmethod
     def load(cls, provider: AuthProxyProvider) -> "AuthProxyIntegrationData":
-        app_names = provider.get_app_names()
-        allowed_endpoints = provider.get_relations_data("allowed_endpoints") or []
-        headers = provider.get_relations_data("headers") or []
-        authenticated_emails = provider.get_relations_data("authenticated_emails") or []
-        authenticated_email_domains = provider.get_relations_data("authenticated_email_domains") or []
+        relations_data = provider.get_merged_relations_data()
 
         return cls(
-            app_names=app_names,
-            allowed_endpoints=allowed_endpoints,
-            headers=headers,
-            authenticated_emails=authenticated_emails,
-            authenticated_email_domains=authenticated_email_domains,
+            app_names=relations_data.app_names,
+            allowed_endpoints=relations_data.allowed_endpoints,
+            headers=relations_data.headers,
+            authenticated_emails=relations_data.authenticated_emails,
+            authenticated_email_domains=relations_data.authenticated_email_domains,
         )
 
 
@@ -122,19 +276,46 @@ class AuthProxyIntegrationData:
 class IngressIntegrationData:
     """The data source from the ingress integration."""
 
-    url: URL = URL()
+    url: str = ""
+
+    @property
+    def redirect_url(self) -> str:
+        # yarl is only needed once the workload configuration is rendered
+        from yarl import URL
+
+        return str(URL(self.url) / "oauth2" / "callback")
 
     def to_env_vars(self) -> EnvVars:
+        from yarl import URL
+
         return {
-            "OAUTH2_PROXY_REDIRECT_URL": str(self.url / "oauth2" / "callback"),
-            "OAUTH2_PROXY_WHITELIST_DOMAINS": self.url.host,
+            "OAUTH2_PROXY_REDIRECT_URL": self.redirect_url,
+            "OAUTH2_PROXY_WHITELIST_DOMAINS": URL(self.url).host,
         }
 
     @classmethod
     def load(cls, requirer: IngressPerAppRequirer) -> "IngressIntegrationData":
         model, app = requirer.charm.model.name, requirer.charm.app.name
         default_url = f"http://{app}.{model}.svc.cluster.local:{OAUTH2_PROXY_API_PORT}"
-        return cls(url=URL(requirer.url or default_url))
+        return cls(url=requirer.url or default_url)
+
+
+@dataclass(frozen=True, slots=True)
+class MetricsIntegrationData:
+    """The data source deciding whether the workload exposes its metrics."""
+
+    enabled: bool = False
+
+    def to_env_vars(self) -> EnvVars:
+        if not self.enabled:
+            return {}
+
+        return {"OAUTH2_PROXY_METRICS_ADDRESS": f"0.0.0.0:{OAUTH2_PROXY_METRICS_PORT}"}
+
+    @classmethod
+    def load(cls, model: Model, enable_metrics: bool) -> "MetricsIntegrationData":
+        # A Prometheus integration always scrapes the metrics endpoint
+        return cls(enabled=enable_metrics or bool(model.relations[METRICS_INTEGRATION_NAME]))
 
 
 @dataclass(frozen=True, slots=True)
@@ -144,24 +325,43 @@ class OAuthIntegrationData:
     issuer_url: str = ""
     client_id: str = "default"
     client_secret: str = "default"
+    authorization_endpoint: str = ""
+    token_endpoint: str = ""
+    userinfo_endpoint: str = ""
+    jwks_endpoint: str = ""
+    skip_oidc_discovery: bool = False
 
     def to_env_vars(self) -> EnvVars:
-        return (
-            {
-                "OAUTH2_PROXY_CLIENT_ID": self.client_id,
-                "OAUTH2_PROXY_CLIENT_SECRET": self.client_secret,
-                "OAUTH2_PROXY_PROVIDER": "oidc",
-                "OAUTH2_PROXY_PROVIDER_DISPLAY_NAME": "Identity Platform",
-                "OAUTH2_PROXY_OIDC_ISSUER_URL": self.issuer_url,
-                "OAUTH2_PROXY_SCOPE": OAUTH_SCOPES,
-                "OAUTH2_PROXY_SKIP_PROVIDER_BUTTON": "true",
-            }
-            if self.issuer_url
-            else {}
-        )
+        if not self.issuer_url:
+            return {}
+
+        env_vars = {
+            "OAUTH2_PROXY_CLIENT_ID": self.client_id,
+            "OAUTH2_PROXY_CLIENT_SECRET": self.client_secret,
+            "OAUTH2_PROXY_PROVIDER": "oidc",
+            "OAUTH2_PROXY_PROVIDER_DISPLAY_NAME": "Identity Platform",
+            "OAUTH2_PROXY_OIDC_ISSUER_URL": self.issuer_url,
+            "OAUTH2_PROXY_SCOPE": OAUTH_SCOPES,
+            "OAUTH2_PROXY_SKIP_PROVIDER_BUTTON": "true",
+        }
+
+        endpoints = {
+            "OAUTH2_PROXY_LOGIN_URL": self.authorization_endpoint,
+            "OAUTH2_PROXY_REDEEM_URL": self.token_endpoint,
+            "OAUTH2_PROXY_PROFILE_URL": self.userinfo_endpoint,
+            "OAUTH2_PROXY_OIDC_JWKS_URL": self.jwks_endpoint,
+        }
+        # Without discovery, oauth2-proxy starts without a round-trip to the provider
+        if self.skip_oidc_discovery and all(endpoints.values()):
+            env_vars["OAUTH2_PROXY_SKIP_OIDC_DISCOVERY"] = "true"
+            env_vars.update(endpoints)
+
+        return env_vars
 
     @classmethod
-    def load(cls, requirer: OAuthRequirer) -> "OAuthIntegrationData":
+    def load(
+        cls, requirer: OAuthRequirer, skip_oidc_discovery: bool = False
+    ) -> "OAuthIntegrationData":
         if not requirer.is_client_created():
             return cls()
 
@@ -170,6 +370,113 @@ class OAuthIntegrationData:
             issuer_url=oauth_provider_info.issuer_url,
             client_id=oauth_provider_info.client_id,
             client_secret=oauth_provider_info.client_secret,
+            authorization_endpoint=oauth_provider_info.authorization_endpoint,
+            token_endpoint=oauth_provider_info.token_endpoint,
+            userinfo_endpoint=oauth_provider_info.userinfo_endpoint,
+            jwks_endpoint=oauth_provider_info.jwks_endpoint,
+            skip_oidc_discovery=skip_oidc_discovery,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class RedisIntegrationData:
+    """The data source from the redis integration.
+
+    In the `sentinel` and `cluster` modes every redis unit is an entry point to
+    the deployment, otherwise the sessions are stored on the redis primary.
+    """
+
+    mode: str = "standalone"
+    hosts: List[str] = field(default_factory=list)
+    primary: str = ""
+    port: str = ""
+    sentinel_port: str = ""
+    sentinel_master_name: str = ""
+    password: str = ""
+
+    def to_env_vars(self) -> EnvVars:
+        if not self.hosts:
+            return {}
+
+        env_vars = {"OAUTH2_PROXY_SESSION_STORE_TYPE": "redis"}
+        if self.password:
+            env_vars["OAUTH2_PROXY_REDIS_PASSWORD"] = self.password
+
+        if self.mode == "sentinel":
+            env_vars["OAUTH2_PROXY_REDIS_USE_SENTINEL"] = "true"
+            env_vars["OAUTH2_PROXY_REDIS_SENTINEL_MASTER_NAME"] = self.sentinel_master_name
+            env_vars["OAUTH2_PROXY_REDIS_SENTINEL_CONNECTION_URLS"] = ",".join(
+                f"redis://{host}:{self.sentinel_port}" for host in self.hosts
+            )
+        elif self.mode == "cluster":
+            env_vars["OAUTH2_PROXY_REDIS_USE_CLUSTER"] = "true"
+            env_vars["OAUTH2_PROXY_REDIS_CLUSTER_CONNECTION_URLS"] = ",".join(
+                f"redis://{host}:{self.port}" for host in self.hosts
+            )
+        else:
+            env_vars["OAUTH2_PROXY_REDIS_CONNECTION_URL"] = f"redis://{self.primary}:{self.port}"
+
+        return env_vars
+
+    @classmethod
+    def load(cls, model: Model, mode: str, sentinel_master_name: str) -> "RedisIntegrationData":
+        if not (relation := model.get_relation(REDIS_INTEGRATION_NAME)) or not relation.app:
+            return cls()
+
+        units_data = [relation.data[unit] for unit in sorted(relation.units, key=lambda u: u.name)]
+        if not (hosts := [data["hostname"] for data in units_data if data.get("hostname")]):
+            return cls()
+
+        unit_data = units_data[0]
+        return cls(
+            mode=mode,
+            hosts=hosts,
+            primary=unit_data.get("leader-host") or hosts[0],
+            port=unit_data.get("port", str(REDIS_PORT)),
+            sentinel_port=unit_data.get("sentinel-port", str(REDIS_SENTINEL_PORT)),
+            sentinel_master_name=sentinel_master_name or relation.app.name,
+            password=unit_data.get("password", ""),
+        )
+
+
+class IntegrationSnapshot:
+    """A read-only view of the integration data sources for a single dispatch.
+
+    Each data source is loaded on first access and reused afterwards. The charm
+    drops the snapshot whenever it writes relation data. The ingress URL is read
+    from the ingress library's stored state, which its own handlers update after
+    the charm is constructed, so it is always loaded afresh.
+    """
+
+    def __init__(self, charm: CharmBase) -> None:
+        self._charm = charm
+
+    @property
+    def ingress(self) -> IngressIntegrationData:
+        return IngressIntegrationData.load(self._charm.ingress_requirer)
+
+    @cached_property
+    def oauth(self) -> OAuthIntegrationData:
+        return OAuthIntegrationData.load(
+            self._charm.oauth, self._charm.charm_config["skip_oidc_discovery"]
+        )
+
+    @cached_property
+    def auth_proxy(self) -> AuthProxyIntegrationData:
+        return AuthProxyIntegrationData.load(self._charm.auth_proxy)
+
+    @cached_property
+    def metrics(self) -> MetricsIntegrationData:
+        return MetricsIntegrationData.load(
+            self._charm.model, self._charm.charm_config["enable_metrics"]
+        )
+
+    @cached_property
+    def redis(self) -> RedisIntegrationData:
+        return RedisIntegrationData.load(
+            self._charm.model,
+            self._charm.charm_config["redis_mode"],
+            self._charm.charm_config["redis_sentinel_master_name"],
         )
 
 
@@ -181,6 +488,11 @@ class TrustedCertificatesTransferIntegration:
             charm, relationship_name="receive-ca-cert"
         )
 
+    @property
+    def ca_bundle(self) -> str:
+        certs = self.cert_transfer_requires.get_all_certificates()
+        return "\n".join(sorted(certs))
+
     def update_trusted_ca_certs(self) -> None:
         """Receive trusted certificates from the certificate_transfer integration.
 
@@ -197,11 +509,5 @@ class TrustedCertificatesTransferIntegration:
         self._push_ca_certs()
 
     def _push_ca_certs(self) -> None:
-        certs = self.cert_transfer_requires.get_all_certificates()
-        ca_bundle = "\n".join(sorted(certs))
-
-        with open(LOCAL_CA_BUNDLE_PATH, mode="wt") as f:
-            f.write(ca_bundle)
-
-        subprocess.run(["update-ca-certificates", "--fresh"], capture_output=True)
-        self._container.push(CERTIFICATES_FILE, CERTIFICATES_FILE.read_text(), make_dirs=True)
+        ca_bundle = build_ca_bundle(load_system_ca_bundle(), self.ca_bundle)
+        self._container.push(CERTIFICATES_FILE, ca_bundle, make_dirs=True)
@@ -4,10 +4,120 @@
 """Define logging helpers."""
 
 import functools
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Union
+
+from ops.charm import CharmBase
+from ops.framework import Object, StoredState
+
+logger = logging.getLogger(__name__)
+
+# The number of most recent samples kept for each handler and span
+HOOK_STATS_WINDOW = 20
+
+_active_spans: List["Span"] = []
+
+
+@dataclass
+class Span:
+    """The wall and CPU time spent in a handler or one of its sub-steps."""
+
+    name: str
+    wall: float = 0.0
+    cpu: float = 0.0
+    children: List["Span"] = field(default_factory=list)
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+@contextmanager
+def timed_span(name: str) -> Iterator[Span]:
+    """Time a block of code, nesting it under the span that is currently running."""
+    span = Span(name)
+    if _active_spans:
+        _active_spans[-1].children.append(span)
+
+    _active_spans.append(span)
+    wall, cpu = time.monotonic(), time.process_time()
+    try:
+        yield span
+    finally:
+        span.wall = time.monotonic() - wall
+        span.cpu = time.process_time() - cpu
+        _active_spans.pop()
+
+
+class HookStats(Object):
+    """Rolling timing statistics of the event handlers, kept in the unit's stored state."""
+
+    _stored = StoredState()
+
+    def __init__(self, charm: CharmBase) -> None:
+        super().__init__(charm, "hook-stats")
+        self._stored.set_default(samples={})
+
+    def record(self, span: Span) -> None:
+        """Record a sample for the span and each of its nested spans."""
+        for s in span.walk():
+            stats = self._stored.samples.get(s.name, {"count": 0, "window": []})
+            window = [
+                *(list(sample) for sample in stats["window"]),
+                [round(s.wall * 1000, 3), round(s.cpu * 1000, 3)],
+            ]
+            self._stored.samples[s.name] = {
+                "count": stats["count"] + 1,
+                "window": window[-HOOK_STATS_WINDOW:],
+            }
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Summarize the recorded samples, with the times in milliseconds."""
+        summary = {}
+        for name, stats in self._stored.samples.items():
+            walls, cpus = zip(*stats["window"])
+            summary[name] = {
+                "count": stats["count"],
+                "wall-last": walls[-1],
+                "wall-mean": round(sum(walls) / len(walls), 3),
+                "wall-max": max(walls),
+                "cpu-mean": round(sum(cpus) / len(cpus), 3),
+                "cpu-max": max(cpus),
+            }
+        return summary
+
+
+class ReconcileCounters(Object):
+    """Counters of the reconcile side effects, kept in the unit's stored state."""
+
+    _stored = StoredState()
+
+    def __init__(self, charm: CharmBase) -> None:
+        super().__init__(charm, "reconcile-counters")
+        self._stored.set_default(counts={}, gauges={})
+
+    def increment(self, name: str) -> None:
+        count = self._stored.counts.get(name, 0) + 1
+        self._stored.counts[name] = count
+        logger.info("reconcile_counter name=%s count=%d", name, count)
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self._stored.gauges[name] = round(value, 3)
+        logger.info("reconcile_gauge name=%s value=%.3f", name, value)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return {**self._stored.counts, **self._stored.gauges}
 
 
 def log_event_handler(logger):
-    """Log with the provided logger when a event handler method is executed.
+    """Log and time the execution of an event handler method.
+
+    The outermost handler of a dispatch records its span, including the nested
+    handlers and sub-steps, in the charm's `hook_stats` when it has one.
 
     Args:
         logger: logger used to log events.
@@ -37,10 +147,20 @@ def log_event_handler(logger):
                 Decorated method.
             """
             logger.info("* running %s.%s", self.__class__.__name__, method.__name__)
+            span = Span(method.__name__)
             try:
-                return method(self, event)
+                with timed_span(method.__name__) as span:
+                    return method(self, event)
             finally:
-                logger.info("* completed %s.%s", self.__class__.__name__, method.__name__)
+                logger.info(
+                    "* completed %s.%s in %.1fms (cpu %.1fms)",
+                    self.__class__.__name__,
+                    method.__name__,
+                    span.wall * 1000,
+                    span.cpu * 1000,
+                )
+                if not _active_spans and (hook_stats := getattr(self, "hook_stats", None)):
+                    hook_stats.record(span)
 
         return decorated
 
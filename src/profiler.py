@@ -0,0 +1,100 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Opt-in profiling of the charm dispatches."""
+
+import io
+import logging
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from ops.charm import CharmBase
+from ops.framework import EventBase, Object, StoredState
+
+# The profiling modules are only imported once a dispatch is profiled
+if TYPE_CHECKING:
+    import cProfile
+    import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FILE = "dispatch-profile.txt"
+PROFILE_TOP_K = 25
+
+
+class DispatchProfiler(Object):
+    """Profile the next N dispatches of the charm with cProfile and tracemalloc.
+
+    Setting `dispatches` to a new value re-arms the profiler and discards the
+    previous reports. Each profiled dispatch appends the top cumulative functions
+    and allocation sites to a report under the charm directory.
+    """
+
+    _stored = StoredState()
+
+    def __init__(self, charm: CharmBase, dispatches: int) -> None:
+        super().__init__(charm, "dispatch-profiler")
+        self._stored.set_default(requested=0, remaining=0)
+        self.report_path = Path(charm.charm_dir) / PROFILE_FILE
+        self._profile: Optional["cProfile.Profile"] = None
+
+        if dispatches != self._stored.requested:
+            self._stored.requested = dispatches
+            self._stored.remaining = max(dispatches, 0)
+            self.report_path.unlink(missing_ok=True)
+
+        if self._stored.remaining > 0:
+            self._start()
+            self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+
+    def _start(self) -> None:
+        import cProfile
+        import tracemalloc
+
+        tracemalloc.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def _on_pre_commit(self, event: EventBase) -> None:
+        if self._profile is None:
+            return
+
+        import tracemalloc
+
+        self._profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        self._stored.remaining -= 1
+        dispatch = os.environ.get("JUJU_DISPATCH_PATH", "unknown")
+        with self.report_path.open("a") as report:
+            report.write(f"# {dispatch} at {time.strftime('%Y-%m-%dT%H:%M:%S%z')}\n")
+            report.write(self._format_report(self._profile, snapshot))
+        logger.info(
+            "Wrote the profile of %s, %d dispatches left to profile",
+            dispatch,
+            self._stored.remaining,
+        )
+        self._profile = None
+
+    @staticmethod
+    def _format_report(profile: "cProfile.Profile", snapshot: "tracemalloc.Snapshot") -> str:
+        import pstats
+
+        stream = io.StringIO()
+        stream.write(f"## Top {PROFILE_TOP_K} functions by cumulative time\n")
+        pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(PROFILE_TOP_K)
+
+        stream.write(f"## Top {PROFILE_TOP_K} allocation sites\n")
+        for stat in snapshot.statistics("lineno")[:PROFILE_TOP_K]:
+            stream.write(f"{stat}\n")
+        stream.write("\n")
+        return stream.getvalue()
+
+    def read_report(self) -> Optional[str]:
+        try:
+            return self.report_path.read_text()
+        except FileNotFoundError:
+            return None
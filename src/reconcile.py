@@ -0,0 +1,75 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fingerprints of the desired workload state used to skip no-op reconciles."""
+
+import hashlib
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Iterable, Iterator, List, Mapping, Sequence
+
+from ops.pebble import Layer
+
+
+def content_digest(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def chunks_digest(chunks: Iterable[str]) -> str:
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.encode())
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
+class Fingerprint:
+    """The content digests of each reconcile sub-step."""
+
+    layer: str = ""
+    files: str = ""
+    ca_certs: str = ""
+
+    def diff(self, other: "Fingerprint") -> List[str]:
+        """Return the names of the sub-steps whose digest differs from `other`."""
+        return [f.name for f in fields(self) if getattr(self, f.name) != getattr(other, f.name)]
+
+    def to_dict(self) -> dict[str, str]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "Fingerprint":
+        return cls(**{f.name: data.get(f.name, "") for f in fields(cls)})
+
+
+@dataclass(frozen=True, slots=True)
+class ConfigFile:
+    """A file-backed workload input that oauth2-proxy re-reads without a restart."""
+
+    path: str
+    lines: Sequence[str] = ()
+
+    def chunks(self) -> Iterator[str]:
+        for line in self.lines:
+            yield f"{line}\n"
+
+
+@dataclass(frozen=True, slots=True)
+class DesiredState:
+    """The workload state the charm reconciles the container towards.
+
+    File-backed inputs are tracked separately from the pebble layer, so that
+    changing their content never replans the workload service.
+    """
+
+    layer: Layer
+    files: Sequence[ConfigFile] = ()
+    ca_certs: str = ""
+
+    def fingerprint(self) -> Fingerprint:
+        return Fingerprint(
+            layer=content_digest(self.layer.to_yaml()),
+            files=chunks_digest(
+                chunk for file in self.files for chunk in (f"{file.path}\0", *file.chunks())
+            ),
+            ca_certs=content_digest(self.ca_certs),
+        )
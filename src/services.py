@@ -1,16 +1,29 @@
 # Copyright 2025 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import hashlib
+import io
+import json
 import logging
 import os
+import re
+import time
 from collections import ChainMap
+from dataclasses import asdict, dataclass
+from enum import Enum
+from typing import Any, Callable, Iterable, Mapping, Optional
 
-from ops import Unit
-from ops.pebble import Layer, LayerDict
+from ops import ModelError, Unit
+from ops.pebble import CheckInfo, CheckStatus
+from ops.pebble import Error as PebbleError
+from ops.pebble import Layer, LayerDict, Plan
 
 from constants import (
     OAUTH2_PROXY_API_PORT,
+    PEBBLE_LIVENESS_CHECK_NAME,
     PEBBLE_READY_CHECK_NAME,
+    PEBBLE_STARTUP_CHECK_NAME,
+    STARTUP_NOTICE_KEY,
     WORKLOAD_CONTAINER,
     WORKLOAD_SERVICE,
 )
@@ -28,29 +41,258 @@ PEBBLE_LAYER_DICT = {
             "command": "/bin/oauth2-proxy",
             "startup": "enabled",
             "override": "replace",
-            "on-check-failure": {PEBBLE_READY_CHECK_NAME: "ignore"},
+            "on-check-failure": {
+                PEBBLE_READY_CHECK_NAME: "ignore",
+                PEBBLE_LIVENESS_CHECK_NAME: "ignore",
+            },
         }
     },
     "checks": {
         PEBBLE_READY_CHECK_NAME: {
             "override": "replace",
+            "level": "ready",
             "period": "10s",
+            "timeout": "3s",
+            "threshold": 3,
             "http": {"url": f"http://localhost:{OAUTH2_PROXY_API_PORT}/ready"},
+        },
+        # Without a level, Kubernetes never restarts the container on a failed liveness
+        # check, Pebble restarts the service instead if configured to
+        PEBBLE_LIVENESS_CHECK_NAME: {
+            "override": "replace",
+            "period": "10s",
+            "timeout": "3s",
+            "threshold": 3,
+            "http": {"url": f"http://localhost:{OAUTH2_PROXY_API_PORT}/ping"},
+        },
+        PEBBLE_STARTUP_CHECK_NAME: {
+            "override": "replace",
+            "startup": "disabled",
+            "period": "10s",
+            "timeout": "3s",
+            "threshold": 3,
+            "exec": {"command": f"/charm/bin/pebble notify {STARTUP_NOTICE_KEY}"},
+        },
+    },
+}
+
+
+@dataclass(frozen=True, slots=True)
+class PebbleLayerOptions:
+    """The cadence of the workload checks and how the workload service is restarted."""
+
+    period: str = "10s"
+    timeout: str = "3s"
+    threshold: int = 3
+    restart_on_liveness_failure: bool = False
+    kill_delay: str = ""
+
+    def apply(self, layer_dict: LayerDict) -> None:
+        if self.kill_delay:
+            layer_dict["services"][WORKLOAD_SERVICE]["kill-delay"] = self.kill_delay
+
+        for check in layer_dict["checks"].values():
+            check.update(period=self.period, timeout=self.timeout, threshold=self.threshold)
+
+        layer_dict["services"][WORKLOAD_SERVICE]["on-check-failure"][
+            PEBBLE_LIVENESS_CHECK_NAME
+        ] = "restart" if self.restart_on_liveness_failure else "ignore"
+
+
+class PebbleLayerTemplate:
+    """An immutable pebble layer template.
+
+    The template is serialized once, and every render builds a fresh layer from it,
+    so renders never share state. The last rendered layer is cached by the hash of
+    its environment and layer options.
+    """
+
+    def __init__(self, layer_dict: LayerDict) -> None:
+        self._template = json.dumps(layer_dict)
+        self._cache_key: Optional[str] = None
+        self._cached_layer: Optional[Layer] = None
+
+    def render(
+        self,
+        env_vars: Mapping[str, Any],
+        layer_options: PebbleLayerOptions = PebbleLayerOptions(),
+    ) -> Layer:
+        cache_key = hashlib.sha256(
+            json.dumps([env_vars, asdict(layer_options)], sort_keys=True).encode()
+        ).hexdigest()
+        if self._cached_layer is None or cache_key != self._cache_key:
+            layer_dict = json.loads(self._template)
+            layer_dict["services"][WORKLOAD_SERVICE]["environment"] = dict(env_vars)
+            layer_options.apply(layer_dict)
+            self._cached_layer, self._cache_key = Layer(layer_dict), cache_key
+
+        return self._cached_layer
+
+
+PEBBLE_LAYER_TEMPLATE = PebbleLayerTemplate(PEBBLE_LAYER_DICT)
+
+# Overrides the ready check with one that always fails, taking the unit out of rotation
+DRAINING_LAYER = Layer({
+    "checks": {
+        PEBBLE_READY_CHECK_NAME: {
+            "override": "replace",
+            "level": "ready",
+            "period": "1s",
+            "threshold": 1,
+            "tcp": {"port": 1},
         }
     },
+})
+
+
+class ChunkReader(io.RawIOBase):
+    """A binary stream reading the encoded text chunks of an iterable on demand."""
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks).encode()
+            except StopIteration:
+                break
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class PlanResult(str, Enum):
+    """The outcome of applying a pebble layer."""
+
+    UNCHANGED = "unchanged"
+    UPDATED = "updated"
+    DEFERRED = "deferred"
+    RESTARTED = "restarted"
+
+
+@dataclass(frozen=True, slots=True)
+class WorkloadProbe:
+    """A point-in-time view of the workload health in the container."""
+
+    plan_drifted: bool
+    service_running: bool
+    check_up: bool
+
+    @property
+    def drifted(self) -> bool:
+        return self.plan_drifted or not self.service_running
+
+
+def check_passed_since(check: Optional[CheckInfo], successes: int) -> bool:
+    """Whether the check is up and succeeded after it had `successes` successful runs.
+
+    A check starts up before it ever runs, so the first successful run is what tells
+    a started workload apart. Pebble older than v1.23 does not count the successes.
+    """
+    if check is None or check.status != CheckStatus.UP:
+        return False
+
+    if check.successes is None:
+        return True
+
+    return check.successes > successes
+
+
+DURATION_FIELDS = ("backoff-delay", "backoff-limit", "kill-delay", "period", "timeout")
+DURATION_REGEX = re.compile(r"(?:(?:\d+\.?\d*|\.\d+)(?:ns|us|µs|ms|s|m|h))+")
+DURATION_PART_REGEX = re.compile(r"(\d+\.?\d*|\.\d+)(ns|us|µs|ms|s|m|h)")
+DURATION_UNITS = {
+    "ns": 1e-9,
+    "us": 1e-6,
+    "µs": 1e-6,
+    "ms": 1e-3,
+    "s": 1.0,
+    "m": 60.0,
+    "h": 3600.0,
 }
 
 
+def parse_duration(value: str) -> Optional[float]:
+    """Parse a Pebble (Go) duration such as "1m30s" into seconds."""
+    if value == "0":
+        return 0.0
+
+    if not DURATION_REGEX.fullmatch(value):
+        return None
+
+    return sum(
+        float(number) * DURATION_UNITS[unit] for number, unit in DURATION_PART_REGEX.findall(value)
+    )
+
+
+def _normalized(config: Mapping[str, Any]) -> dict[str, Any]:
+    config = dict(config)
+
+    # Pebble stores unset (null) environment variables as empty strings
+    if environment := config.get("environment"):
+        config["environment"] = {k: v or "" for k, v in environment.items()}
+
+    # Pebble reads the durations back in Go's format, e.g. "60s" as "1m0s"
+    for key in DURATION_FIELDS:
+        if (
+            isinstance(value := config.get(key), str)
+            and (seconds := parse_duration(value)) is not None
+        ):
+            config[key] = seconds
+
+    return config
+
+
 class PebbleService:
     """Pebble service abstraction running in a Juju unit."""
 
     def __init__(self, unit: Unit) -> None:
         self._unit = unit
         self._container = unit.get_container(WORKLOAD_CONTAINER)
-        self._layer_dict: LayerDict = PEBBLE_LAYER_DICT
+        self._layer_template = PEBBLE_LAYER_TEMPLATE
+
+    def plan(
+        self,
+        layer: Layer,
+        drain_period: int = 0,
+        acquire_restart: Callable[[], bool] = lambda: True,
+    ) -> PlanResult:
+        """Apply the layer, replanning only when the workload service needs a restart.
+
+        A running service is only restarted once `acquire_restart` allows it, otherwise
+        the layer is deferred. With a drain period, a running service is taken out of
+        rotation by failing its ready check, and only restarted once the drain period
+        has passed.
+        """
+        current_plan = self._container.get_plan()
+        service_changed = self._service_changed(current_plan, layer)
+        checks_changed = self._checks_changed(current_plan, layer)
+        service_running = self._service_is_running()
+
+        if not service_changed and service_running:
+            if not checks_changed:
+                return PlanResult.UNCHANGED
+
+            # Pebble applies check changes as soon as the layer is added
+            self._add_layer(layer)
+            return PlanResult.UPDATED
+
+        if service_running and not acquire_restart():
+            return PlanResult.DEFERRED
+
+        if drained := bool(drain_period and service_running):
+            self._drain(drain_period)
 
-    def plan(self, layer: Layer) -> None:
-        self._container.add_layer(WORKLOAD_CONTAINER, layer, combine=True)
+        # Adding the layer also restores the ready check failed by the drain
+        if service_changed or checks_changed or drained:
+            self._add_layer(layer)
 
         try:
             self._container.replan()
@@ -58,7 +300,89 @@ class PebbleService:
             logger.error(f"Failed to replan the workload service: {e}")
             raise PebbleServiceError("Pebble failed to replan the workload service")
 
-    def render_pebble_layer(self, *env_var_sources: EnvVarConvertible) -> Layer:
+        return PlanResult.RESTARTED
+
+    def _add_layer(self, layer: Layer) -> None:
+        try:
+            self._container.add_layer(WORKLOAD_CONTAINER, layer, combine=True)
+        except PebbleError as e:
+            logger.error(f"Failed to add the pebble layer: {e}")
+            raise PebbleServiceError("Pebble rejected the workload layer")
+
+    def _drain(self, drain_period: int) -> None:
+        logger.info(f"Draining the workload service for {drain_period}s before the restart")
+        self._add_layer(DRAINING_LAYER)
+        time.sleep(drain_period)
+
+    def probe(self, layer: Layer) -> WorkloadProbe:
+        """Compare the live plan with the layer and read the readiness check.
+
+        The service status is only queried when the readiness check is not up,
+        since a passing check implies a running service.
+        """
+        plan = self._container.get_plan()
+        checks = self._container.get_checks(PEBBLE_READY_CHECK_NAME)
+        check_up = (
+            check := checks.get(PEBBLE_READY_CHECK_NAME)
+        ) is not None and check.status == CheckStatus.UP
+
+        return WorkloadProbe(
+            plan_drifted=self._service_changed(plan, layer) or self._checks_changed(plan, layer),
+            service_running=check_up or self._service_is_running(),
+            check_up=check_up,
+        )
+
+    def ready_check(self) -> Optional[CheckInfo]:
+        return self._container.get_checks(PEBBLE_READY_CHECK_NAME).get(PEBBLE_READY_CHECK_NAME)
+
+    def start_startup_check(self) -> None:
+        """Start waking the charm up at the check period, until the startup check is stopped."""
+        try:
+            self._container.start_checks(PEBBLE_STARTUP_CHECK_NAME)
+        except PebbleError as e:
+            logger.warning(f"Failed to start the startup check: {e}")
+
+    def stop_startup_check(self) -> None:
+        try:
+            self._container.stop_checks(PEBBLE_STARTUP_CHECK_NAME)
+        except PebbleError as e:
+            logger.warning(f"Failed to stop the startup check: {e}")
+
+    @staticmethod
+    def _service_changed(plan: Plan, layer: Layer) -> bool:
+        if not (current := plan.services.get(WORKLOAD_SERVICE)):
+            return True
+        return _normalized(current.to_dict()) != _normalized(
+            layer.services[WORKLOAD_SERVICE].to_dict()
+        )
+
+    @staticmethod
+    def _checks_changed(plan: Plan, layer: Layer) -> bool:
+        return any(
+            (current := plan.checks.get(name)) is None
+            or _normalized(current.to_dict()) != _normalized(check.to_dict())
+            for name, check in layer.checks.items()
+        )
+
+    def _service_is_running(self) -> bool:
+        try:
+            return self._container.get_service(WORKLOAD_SERVICE).is_running()
+        except ModelError:
+            return False
+
+    def push_file(self, path: str, chunks: Iterable[str]) -> None:
+        """Stream the chunks into a file of the workload container.
+
+        Pebble writes the content to a temporary file and renames it over `path`,
+        so the workload never observes a partially written file.
+        """
+        self._container.push(path, ChunkReader(chunks), make_dirs=True)
+
+    def render_pebble_layer(
+        self,
+        *env_var_sources: EnvVarConvertible,
+        layer_options: PebbleLayerOptions = PebbleLayerOptions(),
+    ) -> Layer:
         proxy_env_vars = {
             "HTTP_PROXY": os.environ.get("HTTP_PROXY"),
             "HTTPS_PROXY": os.environ.get("HTTPS_PROXY"),
@@ -78,6 +402,4 @@ class PebbleService:
                 f"{env_vars['OAUTH2_PROXY_OIDC_ISSUER_URL']}={env_vars['OAUTH2_PROXY_CLIENT_ID']}"
             )
 
-        self._layer_dict["services"][WORKLOAD_SERVICE]["environment"] = env_vars
-
-        return Layer(self._layer_dict)
+        return self._layer_template.render(env_vars, layer_options)
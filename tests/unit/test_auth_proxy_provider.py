@@ -1,17 +1,25 @@
 # Copyright 2025 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import json
+import logging
+import time
 from typing import Any
 
 import ops.testing
 import pytest
 import yaml
+from charms.oauth2_proxy_k8s.v0 import auth_proxy
 from charms.oauth2_proxy_k8s.v0.auth_proxy import (
     AuthProxyConfigChangedEvent,
     AuthProxyConfigRemovedEvent,
     AuthProxyProvider,
+    AuthProxyRelationsData,
 )
 from ops.charm import CharmBase
+from pytest_mock import MockerFixture
+
+logger = logging.getLogger(__name__)
 
 METADATA = """
 name: provider-tester
@@ -87,3 +95,92 @@ class TestAuthProxyProviderIntegration:
             isinstance(e, AuthProxyConfigRemovedEvent)
             for e in context.emitted_events
         )
+
+
+def create_auth_proxy_relations(count: int) -> list[ops.testing.Relation]:
+    return [
+        ops.testing.Relation(
+            endpoint="auth-proxy",
+            interface="auth_proxy",
+            remote_app_name=f"requirer-{i}",
+            remote_app_data={
+                "protected_urls": json.dumps([f"https://requirer-{i}.example.com"]),
+                "allowed_endpoints": json.dumps([f"requirer-{i}/welcome"]),
+                "headers": json.dumps(["X-Auth-Request-User"]),
+                "authenticated_emails": json.dumps([f"user-{i}@example.com"]),
+                "authenticated_email_domains": json.dumps(["example.com"]),
+                "app_name": f"requirer-{i}",
+            },
+        )
+        for i in range(count)
+    ]
+
+
+class TestAuthProxyProviderMergedRelationsData:
+    @pytest.fixture
+    def context(self) -> ops.testing.Context:
+        return ops.testing.Context(AuthProxyProviderCharm, meta=yaml.safe_load(METADATA))
+
+    def test_get_merged_relations_data(
+        self,
+        context: ops.testing.Context,
+    ) -> None:
+        relations = create_auth_proxy_relations(2)
+        state_in = ops.testing.State(leader=True, relations=relations)
+
+        with context(context.on.update_status(), state_in) as manager:
+            data = manager.charm.auth_proxy.get_merged_relations_data()
+
+        assert data.app_names == ["requirer-0", "requirer-1"]
+        assert data.allowed_endpoints == ["requirer-0/welcome", "requirer-1/welcome"]
+        assert data.headers == ["X-Auth-Request-User"]
+        assert data.authenticated_emails == ["user-0@example.com", "user-1@example.com"]
+        assert data.authenticated_email_domains == ["example.com"]
+
+    def test_get_merged_relations_data_without_relations(
+        self,
+        context: ops.testing.Context,
+    ) -> None:
+        with context(context.on.update_status(), ops.testing.State(leader=True)) as manager:
+            data = manager.charm.auth_proxy.get_merged_relations_data()
+
+        assert data == AuthProxyRelationsData()
+
+    @pytest.mark.parametrize("relation_count", [10, 100, 1000])
+    def test_merged_relations_data_benchmark(
+        self,
+        context: ops.testing.Context,
+        relation_count: int,
+        mocker: MockerFixture,
+    ) -> None:
+        """Compares the single-pass merge against the per-key lookups it replaces."""
+        spied_load_data = mocker.spy(auth_proxy, "_load_data")
+        state_in = ops.testing.State(
+            leader=True, relations=create_auth_proxy_relations(relation_count)
+        )
+
+        with context(context.on.update_status(), state_in) as manager:
+            provider = manager.charm.auth_proxy
+
+            start = time.perf_counter()
+            for key in auth_proxy.MERGED_RELATION_KEYS:
+                provider.get_relations_data(key)
+            per_key_elapsed = time.perf_counter() - start
+            per_key_decodes = spied_load_data.call_count
+
+            spied_load_data.reset_mock()
+            start = time.perf_counter()
+            provider.get_merged_relations_data()
+            merged_elapsed = time.perf_counter() - start
+            merged_decodes = spied_load_data.call_count
+
+        logger.info(
+            "%d relations: per-key %.2fms (%d decodes), single-pass %.2fms (%d decodes)",
+            relation_count,
+            per_key_elapsed * 1000,
+            per_key_decodes,
+            merged_elapsed * 1000,
+            merged_decodes,
+        )
+        assert per_key_decodes == len(auth_proxy.MERGED_RELATION_KEYS) * relation_count
+        assert merged_decodes == relation_count
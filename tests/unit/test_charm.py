@@ -6,30 +6,59 @@
 
 """Charm unit tests."""
 
+import json
 import logging
+import ssl
 from dataclasses import replace
+from pathlib import Path
+from typing import Any
 from unittest.mock import MagicMock
 
 import ops.testing
 import pytest
+import yaml
 from conftest import (
+    APP_NAME,
+    AUTH_PROXY_CONFIG,
     COOKIE_SECRET,
     OAUTH_CLIENT_ID,
     OAUTH_CLIENT_SECRET,
     OAUTH_PROVIDER_INFO,
+    OAUTH_SECRET_ID,
     create_state,
+    dict_to_relation_data,
 )
 from ops import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
 from ops.pebble import CheckLevel, CheckStartup, CheckStatus
 from pytest_mock import MockerFixture
 
+from charm import Oauth2ProxyK8sOperatorCharm
 from constants import (
+    ACCESS_LIST_EMAILS_PATH,
     OAUTH2_PROXY_API_PORT,
+    OAUTH2_PROXY_METRICS_PORT,
+    PEBBLE_LIVENESS_CHECK_NAME,
     PEBBLE_READY_CHECK_NAME,
+    PEBBLE_STARTUP_CHECK_NAME,
+    RECONCILE_NOTICE_KEY,
+    RESTART_GRANTS_KEY,
+    RESTART_REQUEST_KEY,
+    STARTUP_NOTICE_KEY,
     WORKLOAD_CONTAINER,
     WORKLOAD_SERVICE,
 )
-from integrations import TrustedCertificatesTransferIntegration
+from exceptions import PebbleServiceError
+from integrations import (
+    AuthProxyIntegrationData,
+    TrustedCertificatesTransferIntegration,
+    build_ca_bundle,
+)
+from log import HOOK_STATS_WINDOW, HookStats, timed_span
+from services import PlanResult
+
+
+def create_pem_certificate(der: bytes) -> str:
+    return ssl.DER_cert_to_PEM_cert(der).strip()
 
 
 class TestPebbleReadyEvent:
@@ -80,6 +109,7 @@ class TestPebbleReadyEvent:
                         "HTTPS_PROXY": None,
                         "HTTP_PROXY": None,
                         "NO_PROXY": None,
+                        "OAUTH2_PROXY_AUTHENTICATED_EMAILS_FILE": ACCESS_LIST_EMAILS_PATH,
                         "OAUTH2_PROXY_CLIENT_ID": "default",
                         "OAUTH2_PROXY_CLIENT_SECRET": "default",
                         "OAUTH2_PROXY_COOKIE_SECRET": COOKIE_SECRET,
@@ -92,7 +122,7 @@ class TestPebbleReadyEvent:
                         "OAUTH2_PROXY_UPSTREAMS": "static://200",
                         "OAUTH2_PROXY_WHITELIST_DOMAINS": "oauth2-proxy-k8s.testing.svc.cluster.local",
                     },
-                    "on-check-failure": {"ready": "ignore"},
+                    "on-check-failure": {"ready": "ignore", "alive": "ignore"},
                 }
             },
             "summary": "oauth2 proxy layer",
@@ -100,9 +130,27 @@ class TestPebbleReadyEvent:
             "checks": {
                 PEBBLE_READY_CHECK_NAME: {
                     "override": "replace",
+                    "level": "ready",
                     "period": "10s",
+                    "timeout": "3s",
+                    "threshold": 3,
                     "http": {"url": "http://localhost:4180/ready"},
-                }
+                },
+                PEBBLE_LIVENESS_CHECK_NAME: {
+                    "override": "replace",
+                    "period": "10s",
+                    "timeout": "3s",
+                    "threshold": 3,
+                    "http": {"url": "http://localhost:4180/ping"},
+                },
+                PEBBLE_STARTUP_CHECK_NAME: {
+                    "override": "replace",
+                    "startup": "disabled",
+                    "period": "10s",
+                    "timeout": "3s",
+                    "threshold": 3,
+                    "exec": {"command": f"/charm/bin/pebble notify {STARTUP_NOTICE_KEY}"},
+                },
             },
         }
 
@@ -172,6 +220,401 @@ class TestConfigChangedEvent:
         assert "OAUTH2_PROXY_SET_AUTHORIZATION_HEADER" not in env
 
 
+class TestGoRuntimeConfig:
+    def render_env(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        config: dict[str, Any],
+    ) -> dict[str, str]:
+        state_in = create_state(config=config, relations=[peer_relation])
+        state_out = context.run(context.on.config_changed(), state_in)
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        return container_out.layers[WORKLOAD_CONTAINER].services[WORKLOAD_SERVICE].environment
+
+    def test_go_runtime_derived_from_resource_limits(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        env = self.render_env(context, peer_relation, {"cpu": "2500m", "memory": "1Gi"})
+
+        assert env["GOMAXPROCS"] == "2"
+        assert env["GOMEMLIMIT"] == str(int(1024**3 * 0.9))
+
+    def test_go_runtime_with_fractional_cpu_and_ratio(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        env = self.render_env(
+            context, peer_relation, {"cpu": "500m", "memory": "1G", "gomemlimit_ratio": 0.5}
+        )
+
+        assert env["GOMAXPROCS"] == "1"
+        assert env["GOMEMLIMIT"] == "500000000"
+
+    def test_go_runtime_overrides(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        env = self.render_env(
+            context,
+            peer_relation,
+            {"cpu": "4", "memory": "1Gi", "gomaxprocs": "8", "gomemlimit": "512MiB"},
+        )
+
+        assert env["GOMAXPROCS"] == "8"
+        assert env["GOMEMLIMIT"] == "512MiB"
+
+    def test_go_runtime_without_resource_limits(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        env = self.render_env(context, peer_relation, {"cpu": "invalid"})
+
+        assert "GOMAXPROCS" not in env
+        assert "GOMEMLIMIT" not in env
+
+    @pytest.mark.parametrize(
+        "config, message",
+        [
+            ({"gomaxprocs": "0"}, "`gomaxprocs` must be a positive integer"),
+            ({"gomaxprocs": "two"}, "`gomaxprocs` must be a positive integer"),
+            ({"gomemlimit": "1G"}, "`gomemlimit` must be a byte count, e.g. 900MiB"),
+            (
+                {"memory": "1Gi", "gomemlimit_ratio": 0.0},
+                "`gomemlimit_ratio` must be greater than 0 and at most 1",
+            ),
+            (
+                {"gomemlimit_ratio": 1.5},
+                "`gomemlimit_ratio` must be greater than 0 and at most 1",
+            ),
+        ],
+    )
+    def test_invalid_go_runtime_options(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        config: dict[str, Any],
+        message: str,
+    ) -> None:
+        state_in = create_state(config=config, relations=[peer_relation])
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        assert state_out.unit_status == BlockedStatus(f"Invalid config: {message}")
+
+
+class TestPebbleCheckConfig:
+    def test_check_options_rendered_into_layer(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        config = {
+            "check_period": "2s",
+            "check_timeout": "1s",
+            "check_threshold": 2,
+            "restart_on_liveness_failure": True,
+        }
+        state_in = create_state(config=config, relations=[peer_relation])
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        layer = state_out.get_container(WORKLOAD_CONTAINER).layers[WORKLOAD_CONTAINER]
+        for name in (PEBBLE_READY_CHECK_NAME, PEBBLE_LIVENESS_CHECK_NAME):
+            check = layer.checks[name]
+            assert (check.period, check.timeout, check.threshold) == ("2s", "1s", 2)
+        assert layer.services[WORKLOAD_SERVICE].on_check_failure == {
+            PEBBLE_READY_CHECK_NAME: "ignore",
+            PEBBLE_LIVENESS_CHECK_NAME: "restart",
+        }
+
+    def test_kill_delay_rendered_into_layer(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_state(config={"kill_delay": "30s"}, relations=[peer_relation])
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        layer = state_out.get_container(WORKLOAD_CONTAINER).layers[WORKLOAD_CONTAINER]
+        assert layer.services[WORKLOAD_SERVICE].kill_delay == "30s"
+
+    @pytest.mark.parametrize(
+        "config, message",
+        [
+            ({"check_period": "10"}, "`check_period` must be a positive duration"),
+            ({"check_period": "0s"}, "`check_period` must be a positive duration"),
+            (
+                {"check_timeout": "10s"},
+                "`check_timeout` must be a positive duration shorter than `check_period`",
+            ),
+            ({"check_threshold": 0}, "`check_threshold` must be at least 1"),
+            ({"kill_delay": "30"}, "`kill_delay` must be a duration"),
+        ],
+    )
+    def test_invalid_check_options(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        config: dict,
+        message: str,
+    ) -> None:
+        state_in = create_state(config=config, relations=[peer_relation])
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        assert state_out.unit_status == BlockedStatus(f"Invalid config: {message}")
+        assert WORKLOAD_CONTAINER not in state_out.get_container(WORKLOAD_CONTAINER).layers
+
+
+class TestMetricsEndpoint:
+    @pytest.fixture
+    def metrics_relation(self) -> ops.testing.Relation:
+        return ops.testing.Relation(endpoint="metrics-endpoint", interface="prometheus_scrape")
+
+    def test_metrics_enabled_by_integration(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        metrics_relation: ops.testing.Relation,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation, metrics_relation])
+
+        state_out = context.run(context.on.relation_joined(metrics_relation), state_in)
+
+        env = (
+            state_out.get_container(WORKLOAD_CONTAINER)
+            .layers[WORKLOAD_CONTAINER]
+            .services[WORKLOAD_SERVICE]
+            .environment
+        )
+        assert env["OAUTH2_PROXY_METRICS_ADDRESS"] == f"0.0.0.0:{OAUTH2_PROXY_METRICS_PORT}"
+        assert {port.port for port in state_out.opened_ports} == {
+            OAUTH2_PROXY_API_PORT,
+            OAUTH2_PROXY_METRICS_PORT,
+        }
+
+        rel_out = state_out.get_relation(metrics_relation.id)
+        scrape_jobs = json.loads(rel_out.local_app_data["scrape_jobs"])
+        assert [job["static_configs"] for job in scrape_jobs] == [
+            [{"targets": [f"*:{OAUTH2_PROXY_METRICS_PORT}"]}]
+        ]
+        assert json.loads(rel_out.local_app_data["scrape_metadata"])["unit"] == (
+            "oauth2-proxy-k8s/0"
+        )
+        assert rel_out.local_unit_data["prometheus_scrape_unit_name"] == "oauth2-proxy-k8s/0"
+
+    def test_metrics_enabled_by_config(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_state(config={"enable_metrics": True}, relations=[peer_relation])
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        env = (
+            state_out.get_container(WORKLOAD_CONTAINER)
+            .layers[WORKLOAD_CONTAINER]
+            .services[WORKLOAD_SERVICE]
+            .environment
+        )
+        assert "OAUTH2_PROXY_METRICS_ADDRESS" in env
+        assert OAUTH2_PROXY_METRICS_PORT in {port.port for port in state_out.opened_ports}
+
+    def test_metrics_disabled(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation])
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        env = (
+            state_out.get_container(WORKLOAD_CONTAINER)
+            .layers[WORKLOAD_CONTAINER]
+            .services[WORKLOAD_SERVICE]
+            .environment
+        )
+        assert "OAUTH2_PROXY_METRICS_ADDRESS" not in env
+        assert {port.port for port in state_out.opened_ports} == {OAUTH2_PROXY_API_PORT}
+
+
+class TestRedisIntegration:
+    @pytest.fixture
+    def redis_relation(self) -> ops.testing.Relation:
+        return ops.testing.Relation(
+            endpoint="redis",
+            interface="redis",
+            remote_app_name="redis-k8s",
+            remote_units_data={
+                0: {"hostname": "redis-k8s-0.redis-k8s-endpoints", "port": "6379"},
+                1: {
+                    "hostname": "redis-k8s-1.redis-k8s-endpoints",
+                    "port": "6379",
+                    "leader-host": "redis-k8s-0.redis-k8s-endpoints",
+                },
+            },
+        )
+
+    def run_redis_changed(
+        self,
+        context: ops.testing.Context,
+        state_in: ops.testing.State,
+        redis_relation: ops.testing.Relation,
+    ) -> dict[str, str]:
+        state_out = context.run(context.on.relation_changed(redis_relation), state_in)
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        return container_out.layers[WORKLOAD_CONTAINER].services[WORKLOAD_SERVICE].environment
+
+    def test_redis_standalone(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        redis_relation: ops.testing.Relation,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation, redis_relation])
+
+        env = self.run_redis_changed(context, state_in, redis_relation)
+
+        assert env["OAUTH2_PROXY_SESSION_STORE_TYPE"] == "redis"
+        assert (
+            env["OAUTH2_PROXY_REDIS_CONNECTION_URL"]
+            == "redis://redis-k8s-0.redis-k8s-endpoints:6379"
+        )
+        assert "OAUTH2_PROXY_REDIS_USE_SENTINEL" not in env
+
+    def test_redis_sentinel(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        redis_relation: ops.testing.Relation,
+    ) -> None:
+        state_in = create_state(
+            config={"redis_mode": "sentinel"}, relations=[peer_relation, redis_relation]
+        )
+
+        env = self.run_redis_changed(context, state_in, redis_relation)
+
+        assert env["OAUTH2_PROXY_REDIS_USE_SENTINEL"] == "true"
+        assert env["OAUTH2_PROXY_REDIS_SENTINEL_MASTER_NAME"] == "redis-k8s"
+        assert env["OAUTH2_PROXY_REDIS_SENTINEL_CONNECTION_URLS"] == (
+            "redis://redis-k8s-0.redis-k8s-endpoints:26379,"
+            "redis://redis-k8s-1.redis-k8s-endpoints:26379"
+        )
+
+    def test_redis_cluster(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        redis_relation: ops.testing.Relation,
+    ) -> None:
+        state_in = create_state(
+            config={"redis_mode": "cluster"}, relations=[peer_relation, redis_relation]
+        )
+
+        env = self.run_redis_changed(context, state_in, redis_relation)
+
+        assert env["OAUTH2_PROXY_REDIS_USE_CLUSTER"] == "true"
+        assert env["OAUTH2_PROXY_REDIS_CLUSTER_CONNECTION_URLS"] == (
+            "redis://redis-k8s-0.redis-k8s-endpoints:6379,"
+            "redis://redis-k8s-1.redis-k8s-endpoints:6379"
+        )
+
+    def test_cookie_sessions_without_redis_units(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        redis_relation = ops.testing.Relation(endpoint="redis", interface="redis")
+        state_in = create_state(relations=[peer_relation, redis_relation])
+
+        env = self.run_redis_changed(context, state_in, redis_relation)
+
+        assert "OAUTH2_PROXY_SESSION_STORE_TYPE" not in env
+
+    def test_follower_waits_for_cookie_secret(
+        self,
+        context: ops.testing.Context,
+    ) -> None:
+        peer_relation = ops.testing.PeerRelation(
+            endpoint="oauth2-proxy", interface="oauth2_proxy_peers", peers_data={1: {}}
+        )
+        state_in = create_state(leader=False, relations=[peer_relation])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+
+        assert state_out.unit_status == WaitingStatus(
+            "Waiting for the leader to share the cookie secret"
+        )
+
+        peer_relation = replace(
+            peer_relation, local_app_data={"cookies_key": json.dumps(COOKIE_SECRET)}
+        )
+        state_out = context.run(
+            context.on.relation_changed(peer_relation, remote_unit=1),
+            replace(state_out, relations=[peer_relation]),
+        )
+
+        assert state_out.unit_status == ActiveStatus()
+
+    def test_redis_unit_departed(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        redis_relation: ops.testing.Relation,
+    ) -> None:
+        state_in = create_state(
+            config={"redis_mode": "cluster"}, relations=[peer_relation, redis_relation]
+        )
+        state_out = context.run(context.on.relation_changed(redis_relation), state_in)
+
+        redis_relation = replace(
+            state_out.get_relation(redis_relation.id),
+            remote_units_data={0: redis_relation.remote_units_data[0]},
+        )
+        state_out = context.run(
+            context.on.relation_departed(redis_relation, remote_unit=1, departing_unit=1),
+            replace(
+                state_out,
+                relations={
+                    *(r for r in state_out.relations if r.id != redis_relation.id),
+                    redis_relation,
+                },
+            ),
+        )
+
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        env = container_out.layers[WORKLOAD_CONTAINER].services[WORKLOAD_SERVICE].environment
+        assert env["OAUTH2_PROXY_REDIS_CLUSTER_CONNECTION_URLS"] == (
+            "redis://redis-k8s-0.redis-k8s-endpoints:6379"
+        )
+
+    def test_invalid_redis_mode(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        redis_relation: ops.testing.Relation,
+    ) -> None:
+        state_in = create_state(
+            config={"redis_mode": "replica"}, relations=[peer_relation, redis_relation]
+        )
+
+        state_out = context.run(context.on.relation_changed(redis_relation), state_in)
+
+        assert state_out.unit_status == BlockedStatus(
+            "Invalid config: `redis_mode` must be one of standalone, sentinel, cluster"
+        )
+
+
 class TestAuthProxyEvents:
     def test_config_file_when_auth_proxy_config_provided(
         self,
@@ -212,6 +655,37 @@ class TestAuthProxyEvents:
         assert file_path.exists()
         assert "test@canonical.com" in file_path.read_text()
 
+    def test_authenticated_emails_change_does_not_replan(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        auth_proxy_relation: ops.testing.Relation,
+        mocker: MockerFixture,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation, auth_proxy_relation])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+
+        mocked_plan = mocker.patch("services.PebbleService.plan")
+        for emails in (["new@canonical.com", "test@canonical.com"], []):
+            auth_proxy_relation = replace(
+                auth_proxy_relation,
+                remote_app_data=dict_to_relation_data({
+                    **AUTH_PROXY_CONFIG,
+                    "authenticated_emails": emails,
+                }),
+            )
+            state_out = context.run(
+                context.on.config_changed(),
+                replace(state_out, relations=[peer_relation, auth_proxy_relation]),
+            )
+            container_out = state_out.get_container(WORKLOAD_CONTAINER)
+            access_list = container_out.get_filesystem(context) / ACCESS_LIST_EMAILS_PATH[1:]
+
+            assert access_list.read_text() == "".join(f"{email}\n" for email in emails)
+
+        mocked_plan.assert_not_called()
+
     def test_forward_auth_updated_when_auth_proxy_set(
         self,
         context: ops.testing.Context,
@@ -272,11 +746,51 @@ class TestAuthProxyEvents:
         layer = container_out.layers[WORKLOAD_CONTAINER]
         env = layer.services[WORKLOAD_CONTAINER].environment
 
-        # authenticated_emails file should not be set since the field was missing
-        assert "OAUTH2_PROXY_AUTHENTICATED_EMAILS_FILE" not in env
+        # The authenticated_emails file is always set and is empty since the field was missing
+        assert env["OAUTH2_PROXY_AUTHENTICATED_EMAILS_FILE"] == ACCESS_LIST_EMAILS_PATH
+        filesystem_root = container_out.get_filesystem(context)
+        assert (filesystem_root / ACCESS_LIST_EMAILS_PATH[1:]).read_text() == ""
         # Default OAUTH2_PROXY_EMAIL_DOMAINS = "*" is always present
         assert env["OAUTH2_PROXY_EMAIL_DOMAINS"] == "*"
 
+    def test_plan_is_identical_for_identical_relations(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        relations = [
+            ops.testing.Relation(
+                endpoint="auth-proxy",
+                interface="auth_proxy",
+                remote_app_name=f"requirer-{i}",
+                remote_app_data=dict_to_relation_data({
+                    **AUTH_PROXY_CONFIG,
+                    "allowed_endpoints": [f"requirer-{i}/welcome", "about/app"],
+                    "authenticated_emails": [f"user-{i}@canonical.com", "test@canonical.com"],
+                    "authenticated_email_domains": [f"requirer-{i}.com", "example.com"],
+                }),
+            )
+            for i in range(5)
+        ]
+
+        outputs = []
+        for ordered_relations in (relations, list(reversed(relations))):
+            state_in = create_state(relations=[peer_relation, *ordered_relations])
+            container = state_in.get_container(WORKLOAD_CONTAINER)
+            state_out = context.run(context.on.pebble_ready(container), state_in)
+            container_out = state_out.get_container(WORKLOAD_CONTAINER)
+            access_list = container_out.get_filesystem(context) / ACCESS_LIST_EMAILS_PATH[1:]
+            outputs.append((
+                container_out.layers[WORKLOAD_CONTAINER].to_yaml(),
+                access_list.read_text(),
+            ))
+
+        assert outputs[0] == outputs[1]
+        env = yaml.safe_load(outputs[0][0])["services"][WORKLOAD_SERVICE]["environment"]
+        assert env["OAUTH2_PROXY_SKIP_AUTH_ROUTES"] == ",".join(
+            ["about/app", *(f"requirer-{i}/welcome" for i in range(5))]
+        )
+
 
 class TestForwardAuthEvents:
     def test_forward_auth_set(
@@ -313,31 +827,38 @@ class TestForwardAuthEvents:
         assert state_out.unit_status == ActiveStatus()
 
 
+def create_reconciled_state(
+    context: ops.testing.Context,
+    state_in: ops.testing.State,
+    check_status: CheckStatus = CheckStatus.UP,
+    successes: int = 0,
+) -> ops.testing.State:
+    container = state_in.get_container(WORKLOAD_CONTAINER)
+    state_out = context.run(context.on.pebble_ready(container), state_in)
+
+    container = replace(
+        state_out.get_container(WORKLOAD_CONTAINER),
+        check_infos={
+            ops.testing.CheckInfo(
+                name=PEBBLE_READY_CHECK_NAME,
+                status=check_status,
+                level=CheckLevel.READY,
+                startup=CheckStartup.UNSET,
+                threshold=None,
+                successes=successes,
+            )
+        },
+    )
+    return replace(state_out, containers={container})
+
+
 class TestUpdateStatusEvent:
     def test_update_status_up_active(
         self,
         context: ops.testing.Context,
         peer_relation: ops.testing.PeerRelation,
-        expected_pebble_layer: ops.pebble.Layer,
     ) -> None:
-        container = ops.testing.Container(
-            name=WORKLOAD_CONTAINER,
-            can_connect=True,
-            layers={"oauth2-proxy": expected_pebble_layer},
-            check_infos={
-                ops.testing.CheckInfo(
-                    name=PEBBLE_READY_CHECK_NAME,
-                    status=ops.pebble.CheckStatus.UP,
-                    level=CheckLevel.UNSET,
-                    startup=CheckStartup.UNSET,
-                    threshold=None,
-                )
-            }
-        )
-
-        state_in = create_state(relations=[peer_relation], container=container)
-        # Simulate ActiveStatus before running update event
-        state_in = replace(state_in, unit_status=ActiveStatus())
+        state_in = create_reconciled_state(context, create_state(relations=[peer_relation]))
 
         state_out = context.run(context.on.update_status(), state_in)
 
@@ -347,27 +868,8 @@ class TestUpdateStatusEvent:
         self,
         context: ops.testing.Context,
         peer_relation: ops.testing.PeerRelation,
-        expected_pebble_layer: ops.pebble.Layer,
     ) -> None:
-        container = ops.testing.Container(
-            name=WORKLOAD_CONTAINER,
-            can_connect=True,
-            layers={"oauth2-proxy": expected_pebble_layer},
-            check_infos={
-                ops.testing.CheckInfo(
-                    name=PEBBLE_READY_CHECK_NAME,
-                    status=CheckStatus.UP,
-                    level=CheckLevel.UNSET,
-                    startup=CheckStartup.UNSET,
-                    threshold=None,
-                )
-            }
-        )
-
-        state_in = create_state(
-            relations=[peer_relation],
-            container=container
-        )
+        state_in = create_reconciled_state(context, create_state(relations=[peer_relation]))
 
         # Verify that update-status does not overwrite BlockedStatus even if checks pass
         initial_status = BlockedStatus()
@@ -381,24 +883,11 @@ class TestUpdateStatusEvent:
         self,
         context: ops.testing.Context,
         peer_relation: ops.testing.PeerRelation,
-        expected_pebble_layer: ops.pebble.Layer,
     ) -> None:
-        container = ops.testing.Container(
-            name=WORKLOAD_CONTAINER,
-            can_connect=True,
-            layers={"oauth2-proxy": expected_pebble_layer},
-            check_infos={
-                ops.testing.CheckInfo(
-                    name=PEBBLE_READY_CHECK_NAME,
-                    status=CheckStatus.DOWN,
-                    level=CheckLevel.UNSET,
-                    startup=CheckStartup.UNSET,
-                    threshold=None,
-                )
-            }
+        state_in = create_reconciled_state(
+            context, create_state(relations=[peer_relation]), check_status=CheckStatus.DOWN
         )
 
-        state_in = create_state(relations=[peer_relation], container=container)
         state_out = context.run(context.on.update_status(), state_in)
 
         assert state_out.unit_status == MaintenanceStatus("Status check: DOWN")
@@ -407,24 +896,8 @@ class TestUpdateStatusEvent:
         self,
         context: ops.testing.Context,
         peer_relation: ops.testing.PeerRelation,
-        expected_pebble_layer: ops.pebble.Layer,
     ) -> None:
-        container = ops.testing.Container(
-            name=WORKLOAD_CONTAINER,
-            can_connect=True,
-            layers={"oauth2-proxy": expected_pebble_layer},
-            check_infos={
-                ops.testing.CheckInfo(
-                    name=PEBBLE_READY_CHECK_NAME,
-                    status=CheckStatus.UP,
-                    level=CheckLevel.UNSET,
-                    startup=CheckStartup.UNSET,
-                    threshold=None,
-                )
-            },
-        )
-
-        state_in = create_state(relations=[peer_relation], container=container)
+        state_in = create_reconciled_state(context, create_state(relations=[peer_relation]))
         # Simulate MaintenanceStatus before running update event
         state_in = replace(state_in, unit_status=MaintenanceStatus("Status check: DOWN"))
 
@@ -432,76 +905,538 @@ class TestUpdateStatusEvent:
 
         assert state_out.unit_status == ActiveStatus()
 
-
-class TestIngressIntegrationEvents:
-    def test_ingress_relation_created(
+    def test_update_status_without_drift_skips_the_reconcile(
         self,
         context: ops.testing.Context,
         peer_relation: ops.testing.PeerRelation,
-        ingress_relation: ops.testing.Relation,
+        mocker: MockerFixture,
     ) -> None:
-        state_in = create_state(relations=[peer_relation, ingress_relation])
-        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_in = create_reconciled_state(context, create_state(relations=[peer_relation]))
+        mocked_holistic_handler = mocker.patch(
+            "charm.Oauth2ProxyK8sOperatorCharm._holistic_handler"
+        )
+        spied_get_services = mocker.spy(ops.model.Container, "get_services")
 
-        state_out = context.run(context.on.pebble_ready(container), state_in)
-        rel_out = state_out.get_relation(ingress_relation.id)
+        context.run(context.on.update_status(), state_in)
 
-        assert rel_out.remote_app_data["url"] == "http://ingress:80/testing-oauth2-proxy-k8s"
-        assert rel_out.local_app_data == {}
+        mocked_holistic_handler.assert_not_called()
+        spied_get_services.assert_not_called()
 
-    def test_ingress_relation_revoked(
+    def test_update_status_reconciles_changed_inputs(
         self,
         context: ops.testing.Context,
         peer_relation: ops.testing.PeerRelation,
-        ingress_relation: ops.testing.Relation,
-        caplog: pytest.LogCaptureFixture,
+        mocker: MockerFixture,
     ) -> None:
-        caplog.set_level(logging.INFO)
-        state_in = create_state(relations=[peer_relation, ingress_relation])
-        state_out = context.run(context.on.relation_broken(ingress_relation), state_in)
+        state_in = create_reconciled_state(context, create_state(relations=[peer_relation]))
+        state_in = replace(state_in, config={"dev": True})
+        mocked_plan = mocker.patch(
+            "services.PebbleService.plan", return_value=PlanResult.RESTARTED
+        )
 
-        assert "This app no longer has ingress" in caplog.text
-        assert state_out.unit_status == ActiveStatus()
+        context.run(context.on.update_status(), state_in)
 
+        mocked_plan.assert_called_once()
 
-class TestOAuthIntegrationEvents:
-    def test_oauth_relation_requirer_data_sent(
+    def test_update_status_replans_drifted_plan(
         self,
         context: ops.testing.Context,
         peer_relation: ops.testing.PeerRelation,
-        oauth_relation: ops.testing.Relation,
-        oauth_secret: ops.testing.Secret,
     ) -> None:
-        state_in = create_state(relations=[peer_relation, oauth_relation], secrets=[oauth_secret])
+        state_in = create_reconciled_state(context, create_state(relations=[peer_relation]))
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        drifted_layer = container.layers[WORKLOAD_CONTAINER].to_dict()
+        drifted_layer["services"][WORKLOAD_SERVICE]["command"] = "/bin/sh"
+        container = replace(
+            container, layers={WORKLOAD_CONTAINER: ops.pebble.Layer(drifted_layer)}
+        )
+        state_in = replace(state_in, containers={container})
 
-        state_out = context.run(context.on.relation_changed(oauth_relation), state_in)
-        rel_out = state_out.get_relation(oauth_relation.id)
+        state_out = context.run(context.on.update_status(), state_in)
 
-        assert rel_out.local_app_data == {
-            "redirect_uri": "http://oauth2-proxy-k8s.testing.svc.cluster.local:4180/oauth2/callback",
-            "scope": "openid email profile offline_access",
-            "token_endpoint_auth_method": "client_secret_basic",
-            "grant_types": '["authorization_code", "refresh_token"]',
-            "audience": "[]",
-        }
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        service = container_out.plan.services[WORKLOAD_SERVICE]
+        assert service.command == "/bin/oauth2-proxy"
+        assert state_out.unit_status == MaintenanceStatus("Waiting for OAuth2 Proxy to be ready")
 
-    def test_config_is_updated_with_oauth_relation_data(
+
+class TestStartupGating:
+    def test_restart_waits_for_the_ready_check(
         self,
         context: ops.testing.Context,
         peer_relation: ops.testing.PeerRelation,
-        oauth_relation: ops.testing.Relation,
-        oauth_secret: ops.testing.Secret,
     ) -> None:
-        state_in = create_state(relations=[peer_relation, oauth_relation], secrets=[oauth_secret])
+        state_in = create_reconciled_state(
+            context, create_state(relations=[peer_relation]), successes=3
+        )
 
-        state_out = context.run(context.on.relation_changed(oauth_relation), state_in)
-        container_out = state_out.get_container(WORKLOAD_CONTAINER)
-        layer = container_out.layers[WORKLOAD_CONTAINER]
-        env = layer.services[WORKLOAD_CONTAINER].environment
+        state_out = context.run(context.on.config_changed(), replace(state_in, config={"dev": True}))
 
-        assert env["OAUTH2_PROXY_CLIENT_ID"] == OAUTH_CLIENT_ID
+        assert state_out.unit_status == MaintenanceStatus("Waiting for OAuth2 Proxy to be ready")
+        stored = state_out.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        assert stored.content["startup"]["successes"] == 3
+
+    def test_startup_completes_once_the_ready_check_passes(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_reconciled_state(
+            context, create_state(relations=[peer_relation]), successes=3
+        )
+        state_out = context.run(context.on.config_changed(), replace(state_in, config={"dev": True}))
+
+        container = state_out.get_container(WORKLOAD_CONTAINER)
+        check = replace(container.get_check_info(PEBBLE_READY_CHECK_NAME), successes=4)
+        container = replace(container, check_infos={check})
+        state_out = context.run(context.on.update_status(), replace(state_out, containers={container}))
+
+        assert state_out.unit_status == ActiveStatus()
+        stored = state_out.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        assert not stored.content["startup"]
+        counters = state_out.get_stored_state(
+            "_stored", owner_path="Oauth2ProxyK8sOperatorCharm/ReconcileCounters[reconcile-counters]"
+        )
+        assert counters.content["gauges"]["startup-seconds"] >= 0
+
+    def test_startup_check_wakes_the_charm_up(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_reconciled_state(
+            context, create_state(relations=[peer_relation]), successes=3
+        )
+        state_out = context.run(context.on.config_changed(), replace(state_in, config={"dev": True}))
+
+        container = state_out.get_container(WORKLOAD_CONTAINER)
+        assert container.get_check_info(PEBBLE_STARTUP_CHECK_NAME).status == CheckStatus.UP
+
+        check = replace(container.get_check_info(PEBBLE_READY_CHECK_NAME), successes=4)
+        container = replace(
+            container,
+            check_infos={check, container.get_check_info(PEBBLE_STARTUP_CHECK_NAME)},
+            notices=[ops.testing.Notice(key=STARTUP_NOTICE_KEY)],
+        )
+        state_out = context.run(
+            context.on.pebble_custom_notice(container, container.notices[0]),
+            replace(state_out, containers={container}),
+        )
+
+        assert state_out.unit_status == ActiveStatus()
+        container = state_out.get_container(WORKLOAD_CONTAINER)
+        assert container.get_check_info(PEBBLE_STARTUP_CHECK_NAME).status == CheckStatus.INACTIVE
+
+    def test_startup_check_stopped_after_the_deadline(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_reconciled_state(
+            context, create_state(relations=[peer_relation]), successes=3
+        )
+        state_out = context.run(context.on.config_changed(), replace(state_in, config={"dev": True}))
+
+        stored = state_out.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        startup = {**stored.content["startup"], "wake_up_deadline": 1}
+        stored = replace(stored, content={**stored.content, "startup": startup})
+        container = replace(
+            state_out.get_container(WORKLOAD_CONTAINER),
+            notices=[ops.testing.Notice(key=STARTUP_NOTICE_KEY)],
+        )
+        state_out = context.run(
+            context.on.pebble_custom_notice(container, container.notices[0]),
+            replace(
+                state_out,
+                containers={container},
+                stored_states={
+                    *(s for s in state_out.stored_states if s.owner_path != stored.owner_path),
+                    stored,
+                },
+            ),
+        )
+
+        assert state_out.unit_status == MaintenanceStatus("Waiting for OAuth2 Proxy to be ready")
+        container = state_out.get_container(WORKLOAD_CONTAINER)
+        assert container.get_check_info(PEBBLE_STARTUP_CHECK_NAME).status == CheckStatus.INACTIVE
+        stored = state_out.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        assert stored.content["startup"]["wake_up_deadline"] is None
+
+    def test_startup_check_stopped_when_blocked(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_reconciled_state(
+            context, create_state(relations=[peer_relation]), successes=3
+        )
+        state_out = context.run(context.on.config_changed(), replace(state_in, config={"dev": True}))
+
+        state_out = context.run(
+            context.on.config_changed(),
+            replace(state_out, config={"dev": True, "check_threshold": 0}),
+        )
+
+        assert isinstance(state_out.unit_status, BlockedStatus)
+        container = state_out.get_container(WORKLOAD_CONTAINER)
+        assert container.get_check_info(PEBBLE_STARTUP_CHECK_NAME).status == CheckStatus.INACTIVE
+
+
+class TestRollingRestart:
+    def create_running_state(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        leader: bool,
+    ) -> ops.testing.State:
+        state = create_reconciled_state(
+            context, create_state(leader=leader, relations=[peer_relation])
+        )
+        return replace(state, config={"dev": True})
+
+    def test_restart_waits_for_the_lock(
+        self,
+        context: ops.testing.Context,
+        mocker: MockerFixture,
+    ) -> None:
+        peer_relation = ops.testing.PeerRelation(
+            endpoint="oauth2-proxy",
+            interface="oauth2_proxy_peers",
+            local_app_data={
+                "cookies_key": json.dumps(COOKIE_SECRET),
+                RESTART_GRANTS_KEY: json.dumps([f"{APP_NAME}/1"]),
+            },
+        )
+        state_in = self.create_running_state(context, peer_relation, leader=False)
+        mocked_replan = mocker.patch("ops.model.Container.replan")
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        mocked_replan.assert_not_called()
+        assert state_out.unit_status == WaitingStatus("Waiting for the restart lock")
+        relation_out = state_out.get_relation(peer_relation.id)
+        assert relation_out.local_unit_data[RESTART_REQUEST_KEY] == "true"
+
+    def test_granted_restart_is_applied(
+        self,
+        context: ops.testing.Context,
+        mocker: MockerFixture,
+    ) -> None:
+        peer_relation = ops.testing.PeerRelation(
+            endpoint="oauth2-proxy",
+            interface="oauth2_proxy_peers",
+            local_app_data={
+                "cookies_key": json.dumps(COOKIE_SECRET),
+                RESTART_GRANTS_KEY: json.dumps([f"{APP_NAME}/0"]),
+            },
+        )
+        state_in = self.create_running_state(context, peer_relation, leader=False)
+        mocked_plan = mocker.patch("services.PebbleService.plan", return_value=PlanResult.RESTARTED)
+
+        context.run(context.on.config_changed(), state_in)
+
+        mocked_plan.assert_called_once()
+
+    def test_leader_grants_restarts_in_batches(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        peer_relation = replace(
+            peer_relation,
+            peers_data={1: {RESTART_REQUEST_KEY: "true"}, 2: {RESTART_REQUEST_KEY: "true"}},
+        )
+        state_in = self.create_running_state(context, peer_relation, leader=True)
+        state_in = replace(state_in, config={"restart_batch_size": 2})
+
+        relation_in = state_in.get_relation(peer_relation.id)
+
+        state_out = context.run(context.on.relation_changed(relation_in, remote_unit=1), state_in)
+
+        relation_out = state_out.get_relation(peer_relation.id)
+        assert json.loads(relation_out.local_app_data[RESTART_GRANTS_KEY]) == [
+            f"{APP_NAME}/1",
+            f"{APP_NAME}/2",
+        ]
+
+    @pytest.mark.parametrize("batch_size", [0, -1])
+    def test_invalid_batch_size(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        batch_size: int,
+    ) -> None:
+        state_in = create_state(
+            leader=True, config={"restart_batch_size": batch_size}, relations=[peer_relation]
+        )
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        assert state_out.unit_status == BlockedStatus(
+            "Invalid config: `restart_batch_size` must be at least 1"
+        )
+
+    @pytest.mark.parametrize("drain_period", [-1, 61])
+    def test_invalid_drain_period(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        drain_period: int,
+    ) -> None:
+        state_in = create_state(
+            config={"restart_drain_period": drain_period}, relations=[peer_relation]
+        )
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        assert state_out.unit_status == BlockedStatus(
+            "Invalid config: `restart_drain_period` must be between 0 and 60"
+        )
+
+    def test_lock_released_once_ready(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        peer_relation = replace(
+            peer_relation,
+            local_unit_data={RESTART_REQUEST_KEY: "true"},
+            peers_data={1: {RESTART_REQUEST_KEY: "true"}},
+        )
+        state_in = self.create_running_state(context, peer_relation, leader=True)
+        relation_in = state_in.get_relation(peer_relation.id)
+        relation_in = replace(
+            relation_in,
+            local_app_data={
+                **relation_in.local_app_data,
+                RESTART_GRANTS_KEY: json.dumps([f"{APP_NAME}/0"]),
+            },
+        )
+        container = replace(
+            state_in.get_container(WORKLOAD_CONTAINER),
+            notices=[ops.testing.Notice(key=STARTUP_NOTICE_KEY)],
+        )
+        state_in = replace(state_in, config={}, relations={relation_in}, containers={container})
+
+        state_out = context.run(
+            context.on.pebble_custom_notice(container, container.notices[0]), state_in
+        )
+
+        relation_out = state_out.get_relation(peer_relation.id)
+        assert RESTART_REQUEST_KEY not in relation_out.local_unit_data
+        assert json.loads(relation_out.local_app_data[RESTART_GRANTS_KEY]) == [f"{APP_NAME}/1"]
+        assert state_out.unit_status == ActiveStatus()
+
+
+class TestIngressIntegrationEvents:
+    def test_ingress_relation_created(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        ingress_relation: ops.testing.Relation,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation, ingress_relation])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+        rel_out = state_out.get_relation(ingress_relation.id)
+
+        assert rel_out.remote_app_data["url"] == "http://ingress:80/testing-oauth2-proxy-k8s"
+        assert rel_out.local_app_data == {}
+
+    def test_ingress_relation_revoked(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        ingress_relation: ops.testing.Relation,
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        caplog.set_level(logging.INFO)
+        state_in = create_state(relations=[peer_relation, ingress_relation])
+        state_out = context.run(context.on.relation_broken(ingress_relation), state_in)
+
+        assert "This app no longer has ingress" in caplog.text
+        assert state_out.unit_status == ActiveStatus()
+
+    def test_ingress_url_changes_applied(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        ingress_relation: ops.testing.Relation,
+        oauth_relation: ops.testing.Relation,
+        oauth_secret: ops.testing.Secret,
+    ) -> None:
+        ingress_relation = replace(
+            ingress_relation, remote_app_data={"ingress": json.dumps({"url": "http://ingress/old"})}
+        )
+        state_in = create_state(
+            relations=[peer_relation, ingress_relation, oauth_relation], secrets=[oauth_secret]
+        )
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+
+        ingress_relation = replace(
+            state_out.get_relation(ingress_relation.id),
+            remote_app_data={"ingress": json.dumps({"url": "http://ingress/new"})},
+        )
+        state_out = context.run(
+            context.on.relation_changed(ingress_relation),
+            replace(
+                state_out,
+                relations={
+                    *(r for r in state_out.relations if r.id != ingress_relation.id),
+                    ingress_relation,
+                },
+            ),
+        )
+
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        env = container_out.layers[WORKLOAD_CONTAINER].services[WORKLOAD_SERVICE].environment
+        assert env["OAUTH2_PROXY_REDIRECT_URL"] == "http://ingress/new/oauth2/callback"
+        oauth_out = state_out.get_relation(oauth_relation.id)
+        assert oauth_out.local_app_data["redirect_uri"] == "http://ingress/new/oauth2/callback"
+
+        ingress_relation = state_out.get_relation(ingress_relation.id)
+        state_out = context.run(context.on.relation_broken(ingress_relation), state_out)
+
+        default_url = "http://oauth2-proxy-k8s.testing.svc.cluster.local:4180/oauth2/callback"
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        env = container_out.layers[WORKLOAD_CONTAINER].services[WORKLOAD_SERVICE].environment
+        assert env["OAUTH2_PROXY_REDIRECT_URL"] == default_url
+        oauth_out = state_out.get_relation(oauth_relation.id)
+        assert oauth_out.local_app_data["redirect_uri"] == default_url
+
+
+class TestOAuthIntegrationEvents:
+    def test_oauth_relation_requirer_data_sent(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        oauth_relation: ops.testing.Relation,
+        oauth_secret: ops.testing.Secret,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation, oauth_relation], secrets=[oauth_secret])
+
+        state_out = context.run(context.on.relation_changed(oauth_relation), state_in)
+        rel_out = state_out.get_relation(oauth_relation.id)
+
+        assert rel_out.local_app_data == {
+            "redirect_uri": "http://oauth2-proxy-k8s.testing.svc.cluster.local:4180/oauth2/callback",
+            "scope": "openid email profile offline_access",
+            "token_endpoint_auth_method": "client_secret_basic",
+            "grant_types": '["authorization_code", "refresh_token"]',
+            "audience": "[]",
+        }
+
+    def test_config_is_updated_with_oauth_relation_data(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        oauth_relation: ops.testing.Relation,
+        oauth_secret: ops.testing.Secret,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation, oauth_relation], secrets=[oauth_secret])
+
+        state_out = context.run(context.on.relation_changed(oauth_relation), state_in)
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        layer = container_out.layers[WORKLOAD_CONTAINER]
+        env = layer.services[WORKLOAD_CONTAINER].environment
+
+        assert env["OAUTH2_PROXY_CLIENT_ID"] == OAUTH_CLIENT_ID
         assert env["OAUTH2_PROXY_CLIENT_SECRET"] == OAUTH_CLIENT_SECRET
         assert env["OAUTH2_PROXY_OIDC_ISSUER_URL"] == "https://example.oidc.com"
+        assert "OAUTH2_PROXY_SKIP_OIDC_DISCOVERY" not in env
+
+    def test_oidc_discovery_skipped(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        oauth_relation: ops.testing.Relation,
+        oauth_secret: ops.testing.Secret,
+    ) -> None:
+        state_in = create_state(
+            config={"skip_oidc_discovery": True},
+            relations=[peer_relation, oauth_relation],
+            secrets=[oauth_secret],
+        )
+
+        state_out = context.run(context.on.relation_changed(oauth_relation), state_in)
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        env = container_out.layers[WORKLOAD_CONTAINER].services[WORKLOAD_SERVICE].environment
+
+        assert env["OAUTH2_PROXY_SKIP_OIDC_DISCOVERY"] == "true"
+        assert env["OAUTH2_PROXY_LOGIN_URL"] == OAUTH_PROVIDER_INFO["authorization_endpoint"]
+        assert env["OAUTH2_PROXY_REDEEM_URL"] == OAUTH_PROVIDER_INFO["token_endpoint"]
+        assert env["OAUTH2_PROXY_PROFILE_URL"] == OAUTH_PROVIDER_INFO["userinfo_endpoint"]
+        assert env["OAUTH2_PROXY_OIDC_JWKS_URL"] == OAUTH_PROVIDER_INFO["jwks_endpoint"]
+        assert env["OAUTH2_PROXY_OIDC_ISSUER_URL"] == OAUTH_PROVIDER_INFO["issuer_url"]
+
+
+class TestOAuthClientSecretCache:
+    def test_secret_fetched_once_after_relation_data_written(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        ingress_relation: ops.testing.Relation,
+        oauth_relation: ops.testing.Relation,
+        oauth_secret: ops.testing.Secret,
+        mocker: MockerFixture,
+    ) -> None:
+        spied_get_secret = mocker.spy(ops.model.Model, "get_secret")
+        state_in = create_state(
+            relations=[peer_relation, ingress_relation, oauth_relation],
+            secrets=[oauth_secret],
+        )
+
+        with context(context.on.relation_changed(ingress_relation), state_in) as manager:
+            manager.run()
+            manager.charm._invalidate_integration_snapshot()
+            manager.charm._pebble_layer
+
+        spied_get_secret.assert_called_once()
+
+    def test_secret_refreshed_on_secret_changed(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        oauth_relation: ops.testing.Relation,
+        oauth_secret: ops.testing.Secret,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation, oauth_relation], secrets=[oauth_secret])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+
+        rotated_secret = replace(
+            oauth_secret, owner=None, latest_content={"secret": "r0t4t3d"}
+        )
+        state_out = context.run(
+            context.on.secret_changed(rotated_secret),
+            replace(state_out, secrets=[rotated_secret]),
+        )
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        env = container_out.layers[WORKLOAD_CONTAINER].services[WORKLOAD_SERVICE].environment
+
+        assert env["OAUTH2_PROXY_CLIENT_SECRET"] == "r0t4t3d"
+        stored = state_out.get_stored_state(
+            "_stored", owner_path="Oauth2ProxyK8sOperatorCharm/SecretCache[secret-cache]"
+        )
+        assert stored.content["revisions"] == {OAUTH_SECRET_ID: 1}
+
+    def test_unknown_secret_changed_ignored(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        mocker: MockerFixture,
+    ) -> None:
+        mocked_holistic_handler = mocker.patch(
+            "charm.Oauth2ProxyK8sOperatorCharm._holistic_handler"
+        )
+        secret = ops.testing.Secret(tracked_content={"key": "value"})
+        state_in = create_state(relations=[peer_relation], secrets=[secret])
+
+        context.run(context.on.secret_changed(secret), state_in)
+
+        mocked_holistic_handler.assert_not_called()
 
 
 class TestTrustedCertificatesTransferIntegration:
@@ -540,6 +1475,46 @@ class TestTrustedCertificatesTransferIntegration:
 
         mocked_update.assert_called_once()
 
+    def test_ca_bundle_deduplicates_certificates(self) -> None:
+        system_cert, shared_cert, relation_cert = (
+            create_pem_certificate(der) for der in (b"system", b"shared", b"relation")
+        )
+
+        ca_bundle = build_ca_bundle(
+            f"{system_cert}\n{shared_cert}", f"{shared_cert}\n{relation_cert}"
+        )
+
+        assert ca_bundle == f"{system_cert}\n{shared_cert}\n{relation_cert}\n"
+
+    def test_ca_bundle_skips_malformed_certificates(self) -> None:
+        malformed = "-----BEGIN CERTIFICATE-----\n!!!\n-----END CERTIFICATE-----"
+
+        ca_bundle = build_ca_bundle(malformed, create_pem_certificate(b"relation"))
+
+        assert ca_bundle == create_pem_certificate(b"relation") + "\n"
+
+    def test_ca_bundle_pushed_to_workload(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        mocked_push_ca_certs: MagicMock,
+        mocker: MockerFixture,
+    ) -> None:
+        mocker.stop(mocked_push_ca_certs)
+        mocker.patch(
+            "integrations.load_system_ca_bundle", return_value=create_pem_certificate(b"system")
+        )
+        mocked_run = mocker.patch("subprocess.run")
+        state_in = create_state(relations=[peer_relation])
+
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+        container_out = state_out.get_container(WORKLOAD_CONTAINER)
+        ca_file = container_out.get_filesystem(context) / "etc/ssl/certs/ca-certificates.crt"
+
+        assert ca_file.read_text() == create_pem_certificate(b"system") + "\n"
+        mocked_run.assert_not_called()
+
 
 class TestEnableExtraJWTBearerTokens:
     def test_enable_extra_jwt_bearer_tokens(
@@ -615,3 +1590,333 @@ class TestGetExtraJWTIssuers:
             context.run(context.on.action(self.action_name), state_in)
 
         assert "`enable_jwt_bearer_tokens` is not enabled" in exc_info.value.message
+
+
+class TestHookStats:
+    action_name = "hook-stats"
+
+    def test_hook_stats_record_handlers_and_sub_steps(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+        state_out = context.run(context.on.config_changed(), state_out)
+
+        context.run(context.on.action(self.action_name), state_out)
+        stats = json.loads(context.action_results["hook-stats"])
+
+        assert stats["_on_pebble_ready"]["count"] == 1
+        assert stats["_on_config_changed"]["count"] == 1
+        assert stats["_holistic_handler"]["count"] == 2
+        assert {"render-layer", "push-access-list", "rebuild-ca-bundle", "replan"} <= stats.keys()
+        assert stats["replan"]["wall-max"] >= stats["replan"]["wall-mean"]
+
+    def test_hook_stats_keep_a_rolling_window(self) -> None:
+        hook_stats = MagicMock(spec=HookStats, _stored=MagicMock(samples={}))
+
+        for _ in range(HOOK_STATS_WINDOW + 5):
+            with timed_span("handler") as span:
+                with timed_span("sub-step"):
+                    pass
+            HookStats.record(hook_stats, span)
+
+        samples = hook_stats._stored.samples
+        assert samples["handler"]["count"] == samples["sub-step"]["count"] == HOOK_STATS_WINDOW + 5
+        assert len(samples["handler"]["window"]) == HOOK_STATS_WINDOW
+
+
+class TestReconcileStats:
+    action_name = "reconcile-stats"
+
+    def test_reconcile_stats(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_state(can_connect=False, relations=[peer_relation])
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        container = replace(state_out.get_container(WORKLOAD_CONTAINER), can_connect=True)
+        state_out = replace(state_out, containers={container})
+        state_out = context.run(context.on.pebble_ready(container), state_out)
+        state_out = context.run(context.on.config_changed(), replace(state_out, config={"dev": True}))
+        state_out = context.run(context.on.update_status(), state_out)
+
+        context.run(context.on.action(self.action_name), state_out)
+
+        assert context.action_results.pop("startup-seconds") >= 0
+        assert context.action_results == {
+            "service-restarts": 2,
+            "access-list-pushes": 1,
+            "ca-bundle-rebuilds": 1,
+            "reconcile-requests": 1,
+            "forward-auth-writes": 1,
+        }
+
+    def test_forward_auth_writes_counted_on_leader_only(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        forward_auth_relation: ops.testing.Relation,
+    ) -> None:
+        state_in = create_state(leader=False, relations=[peer_relation, forward_auth_relation])
+
+        with context(context.on.update_status(), state_in) as manager:
+            manager.charm._update_forward_auth_config()
+            counts = manager.charm.reconcile_counters.stats()
+
+        assert "forward-auth-writes" not in counts
+
+
+class TestDispatchProfiler:
+    action_name = "dump-profile"
+
+    @pytest.fixture
+    def context(self, tmp_path: Path) -> ops.testing.Context:
+        return ops.testing.Context(Oauth2ProxyK8sOperatorCharm, charm_root=tmp_path)
+
+    def test_profile_next_dispatches(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation], config={"profile_dispatches": 2})
+
+        state_out = context.run(context.on.config_changed(), state_in)
+        state_out = context.run(context.on.update_status(), state_out)
+        state_out = context.run(context.on.update_status(), state_out)
+        context.run(context.on.action(self.action_name), state_out)
+        profile = context.action_results["profile"]
+
+        assert profile.count("## Top 25 functions by cumulative time") == 2
+        assert "_on_config_changed" in profile
+        assert "## Top 25 allocation sites" in profile
+
+    def test_dump_profile_without_profile(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation])
+
+        with pytest.raises(ops.testing.ActionFailed):
+            context.run(context.on.action(self.action_name), state_in)
+
+
+class TestReconcile:
+    def test_unchanged_state_skips_the_reconcile(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        auth_proxy_relation: ops.testing.Relation,
+        mocker: MockerFixture,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation, auth_proxy_relation])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+
+        mocked_plan = mocker.patch("services.PebbleService.plan")
+        mocked_push = mocker.patch("ops.model.Container.push")
+        state_out = context.run(context.on.config_changed(), state_out)
+
+        mocked_plan.assert_not_called()
+        mocked_push.assert_not_called()
+        assert state_out.unit_status == ActiveStatus()
+
+    def test_only_changed_steps_are_reconciled(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        mocker: MockerFixture,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+
+        mocked_update_ca = mocker.patch.object(
+            TrustedCertificatesTransferIntegration, "update_trusted_ca_certs"
+        )
+        state_out = context.run(
+            context.on.config_changed(), replace(state_out, config={"dev": True})
+        )
+
+        mocked_update_ca.assert_not_called()
+        stored = state_out.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        assert stored.content["last_changed_steps"] == ["layer"]
+        layer = state_out.get_container(WORKLOAD_CONTAINER).layers[WORKLOAD_CONTAINER]
+        assert layer.services[WORKLOAD_SERVICE].environment[
+            "OAUTH2_PROXY_SSL_INSECURE_SKIP_VERIFY"
+        ] == "true"
+
+    def test_pebble_ready_forces_the_reconcile(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        mocker: MockerFixture,
+    ) -> None:
+        state_in = create_state(relations=[peer_relation])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+
+        mocked_plan = mocker.patch("services.PebbleService.plan")
+        container = state_out.get_container(WORKLOAD_CONTAINER)
+        context.run(context.on.pebble_ready(container), state_out)
+
+        mocked_plan.assert_called_once()
+
+    def test_failed_replan_is_retried(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        mocker: MockerFixture,
+    ) -> None:
+        mocked_plan = mocker.patch(
+            "services.PebbleService.plan", side_effect=[PebbleServiceError("error"), PlanResult.RESTARTED]
+        )
+        state_in = create_state(relations=[peer_relation])
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+
+        state_out = context.run(context.on.pebble_ready(container), state_in)
+        assert isinstance(state_out.unit_status, BlockedStatus)
+
+        state_out = context.run(context.on.config_changed(), state_out)
+
+        assert mocked_plan.call_count == 2
+        assert state_out.unit_status == MaintenanceStatus("Waiting for OAuth2 Proxy to be ready")
+
+
+class TestReconcileRequest:
+    def test_events_coalesced_while_container_unreachable(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        auth_proxy_relation: ops.testing.Relation,
+        mocker: MockerFixture,
+    ) -> None:
+        state = create_state(can_connect=False, relations=[peer_relation, auth_proxy_relation])
+        for _ in range(5):
+            state = context.run(context.on.relation_changed(auth_proxy_relation), state)
+
+        assert not state.deferred
+        stored = state.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        assert stored.content["reconcile_requested"]
+
+        spied_holistic_handler = mocker.spy(Oauth2ProxyK8sOperatorCharm, "_holistic_handler")
+        container = replace(state.get_container(WORKLOAD_CONTAINER), can_connect=True)
+        state = context.run(
+            context.on.pebble_ready(container), replace(state, containers={container})
+        )
+
+        assert spied_holistic_handler.call_count == 1
+        stored = state.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        assert not stored.content["reconcile_requested"]
+        assert state.unit_status == ActiveStatus()
+
+    def test_reconcile_request_completed_by_any_reconcile(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        auth_proxy_relation: ops.testing.Relation,
+        forward_auth_relation: ops.testing.Relation,
+    ) -> None:
+        forward_auth_relation = replace(forward_auth_relation, local_app_data={})
+        relations = [peer_relation, auth_proxy_relation, forward_auth_relation]
+        state = create_state(relations=relations)
+        state = context.run(context.on.relation_changed(auth_proxy_relation), state)
+
+        assert state.unit_status == WaitingStatus("Waiting for OAuth2 Proxy service")
+
+        state = context.run(context.on.config_changed(), state)
+
+        rel_out = state.get_relation(forward_auth_relation.id)
+        assert json.loads(rel_out.local_app_data["app_names"]) == ["requirer"]
+        stored = state.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        assert not stored.content["reconcile_requested"]
+
+    def test_custom_notice_drains_reconcile_request(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        auth_proxy_relation: ops.testing.Relation,
+        forward_auth_relation: ops.testing.Relation,
+    ) -> None:
+        forward_auth_relation = replace(forward_auth_relation, local_app_data={})
+        relations = [peer_relation, auth_proxy_relation, forward_auth_relation]
+        state = create_state(can_connect=False, relations=relations)
+        state = context.run(context.on.relation_changed(auth_proxy_relation), state)
+
+        notice = ops.testing.Notice(key=RECONCILE_NOTICE_KEY)
+        container = replace(
+            state.get_container(WORKLOAD_CONTAINER), can_connect=True, notices=[notice]
+        )
+        state = context.run(
+            context.on.pebble_custom_notice(container, notice),
+            replace(state, containers={container}),
+        )
+
+        rel_out = state.get_relation(forward_auth_relation.id)
+        assert json.loads(rel_out.local_app_data["app_names"]) == ["requirer"]
+        stored = state.get_stored_state("_stored", owner_path="Oauth2ProxyK8sOperatorCharm")
+        assert not stored.content["reconcile_requested"]
+
+
+class TestIntegrationSnapshot:
+    def test_integration_data_loaded_once_per_dispatch(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        ingress_relation: ops.testing.Relation,
+        auth_proxy_relation: ops.testing.Relation,
+        mocker: MockerFixture,
+    ) -> None:
+        spied_auth_proxy_load = mocker.spy(AuthProxyIntegrationData, "load")
+        state_in = create_state(
+            relations=[peer_relation, ingress_relation, auth_proxy_relation]
+        )
+        container = state_in.get_container(WORKLOAD_CONTAINER)
+
+        context.run(context.on.pebble_ready(container), state_in)
+
+        assert spied_auth_proxy_load.call_count == 1
+
+    def test_snapshot_reloaded_after_relation_data_written(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        auth_proxy_relation: ops.testing.Relation,
+        mocked_forward_auth_update: MagicMock,
+        mocked_oauth2_proxy_is_running: MagicMock,
+        mocker: MockerFixture,
+    ) -> None:
+        spied_auth_proxy_load = mocker.spy(AuthProxyIntegrationData, "load")
+        state_in = create_state(relations=[peer_relation, auth_proxy_relation])
+
+        with context(context.on.relation_changed(auth_proxy_relation), state_in) as manager:
+            manager.run()
+            load_count = spied_auth_proxy_load.call_count
+            manager.charm._forward_auth_config
+
+        assert spied_auth_proxy_load.call_count == load_count + 1
+
+    def test_secret_fetched_once_for_extra_jwt_issuers(
+        self,
+        context: ops.testing.Context,
+        peer_relation: ops.testing.PeerRelation,
+        oauth_relation: ops.testing.Relation,
+        oauth_secret: ops.testing.Secret,
+        mocked_oauth2_proxy_is_running: MagicMock,
+        mocker: MockerFixture,
+    ) -> None:
+        spied_get_secret = mocker.spy(ops.model.Model, "get_secret")
+        state_in = create_state(
+            relations=[peer_relation, oauth_relation],
+            secrets=[oauth_secret],
+            config={"enable_jwt_bearer_tokens": True},
+        )
+
+        context.run(context.on.action("get-extra-jwt-issuers"), state_in)
+
+        spied_get_secret.assert_called_once()
@@ -0,0 +1,50 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def imported_modules(module: str) -> set[str]:
+    """Import `module` in a fresh interpreter and list the modules from its `-X importtime` report."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    return {
+        line.rsplit("|", 1)[-1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "cumulative" not in line
+    }
+
+
+# Modules the charm only needs on first use, so that a new top-level import of
+# one of them shows up as a cold-start regression
+DEFERRED_MODULES = ["yarl", "cProfile", "pstats", "tracemalloc"]
+
+
+@pytest.fixture(scope="module")
+def charm_modules() -> set[str]:
+    return imported_modules("charm")
+
+
+@pytest.mark.parametrize("module", DEFERRED_MODULES)
+def test_charm_import_defers(charm_modules: set[str], module: str) -> None:
+    assert module not in charm_modules
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["charms.oauth2_proxy_k8s.v0.auth_proxy", "charms.oauth2_proxy_k8s.v0.forward_auth"],
+)
+def test_lib_import_defers_jsonschema(module: str) -> None:
+    # The charm itself still loads jsonschema through the hydra oauth lib, the saving
+    # goes to the requirer charms importing these libs
+    assert "jsonschema" not in imported_modules(module)
@@ -0,0 +1,262 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from typing import Optional
+from unittest.mock import MagicMock, call
+
+import pytest
+from ops.pebble import APIError, ChangeError, CheckStatus, Layer, Plan
+from pytest_mock import MockerFixture
+
+from constants import (
+    ACCESS_LIST_EMAILS_PATH,
+    PEBBLE_READY_CHECK_NAME,
+    WORKLOAD_CONTAINER,
+    WORKLOAD_SERVICE,
+)
+from exceptions import PebbleServiceError
+from services import (
+    DRAINING_LAYER,
+    PEBBLE_LAYER_DICT,
+    ChunkReader,
+    PebbleLayerOptions,
+    PebbleLayerTemplate,
+    PebbleService,
+    PlanResult,
+    WorkloadProbe,
+    parse_duration,
+)
+
+
+class TestChunkReader:
+    def test_read_across_chunks(self) -> None:
+        reader = ChunkReader(["ab", "cde", "", "f"])
+
+        assert reader.read(0) == b""
+        assert reader.read(4) == b"abcd"
+        assert reader.read(4) == b"ef"
+        assert reader.read(4) == b""
+
+    def test_read_all(self) -> None:
+        reader = ChunkReader(f"user-{i}@example.com\n" for i in range(3))
+
+        assert reader.read() == b"user-0@example.com\nuser-1@example.com\nuser-2@example.com\n"
+
+
+class TestPebbleLayerTemplate:
+    def test_render_does_not_mutate_template(self) -> None:
+        template = PebbleLayerTemplate(PEBBLE_LAYER_DICT)
+
+        layer = template.render({"KEY": "value"})
+
+        assert layer.services[WORKLOAD_SERVICE].environment == {"KEY": "value"}
+        assert "environment" not in PEBBLE_LAYER_DICT["services"][WORKLOAD_SERVICE]
+
+    def test_render_does_not_leak_environment(self) -> None:
+        template = PebbleLayerTemplate(PEBBLE_LAYER_DICT)
+
+        first = template.render({"KEY": "value"})
+        second = template.render({"OTHER_KEY": "value"})
+
+        assert first.services[WORKLOAD_SERVICE].environment == {"KEY": "value"}
+        assert second.services[WORKLOAD_SERVICE].environment == {"OTHER_KEY": "value"}
+
+    def test_render_caches_last_layer(self) -> None:
+        template = PebbleLayerTemplate(PEBBLE_LAYER_DICT)
+
+        layer = template.render({"KEY": "value"})
+
+        assert template.render({"KEY": "value"}) is layer
+        assert template.render({"KEY": "other"}) is not layer
+
+    def test_render_with_changed_check_options(self) -> None:
+        template = PebbleLayerTemplate(PEBBLE_LAYER_DICT)
+        layer = template.render({"KEY": "value"})
+
+        rendered = template.render({"KEY": "value"}, PebbleLayerOptions(period="2s"))
+
+        assert rendered is not layer
+        assert rendered.checks[PEBBLE_READY_CHECK_NAME].period == "2s"
+        assert layer.checks[PEBBLE_READY_CHECK_NAME].period == "10s"
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [("0", 0.0), ("10s", 10.0), ("1m30s", 90.0), ("1.5h", 5400.0), ("500ms", 0.5), ("10", None)],
+)
+def test_parse_duration(value: str, seconds: Optional[float]) -> None:
+    assert parse_duration(value) == seconds
+
+
+class TestPebbleService:
+    @pytest.fixture
+    def pebble_service(self, mocked_container: MagicMock) -> PebbleService:
+        return PebbleService(MagicMock(get_container=MagicMock(return_value=mocked_container)))
+
+    def test_push_file_streams_chunks(
+        self, pebble_service: PebbleService, mocked_container: MagicMock
+    ) -> None:
+        consumed = []
+
+        def chunks():
+            for i in range(50_000):
+                consumed.append(i)
+                yield f"user-{i}@example.com\n"
+
+        pebble_service.push_file(ACCESS_LIST_EMAILS_PATH, chunks())
+
+        path, source = mocked_container.push.call_args.args
+        assert path == ACCESS_LIST_EMAILS_PATH
+        assert not consumed
+        assert source.read(19) == b"user-0@example.com\n"
+        assert consumed == [0]
+
+    @pytest.fixture
+    def layer(self, pebble_service: PebbleService) -> Layer:
+        return pebble_service.render_pebble_layer()
+
+    def test_plan_unchanged(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        mocked_container.get_plan.return_value = Plan(layer.to_dict())  # type: ignore[arg-type]
+
+        assert pebble_service.plan(layer) == PlanResult.UNCHANGED
+        mocked_container.add_layer.assert_not_called()
+        mocked_container.replan.assert_not_called()
+
+    def test_plan_with_changed_checks(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        current_layer = layer.to_dict()
+        current_layer["checks"][PEBBLE_READY_CHECK_NAME]["period"] = "1m"
+        mocked_container.get_plan.return_value = Plan(current_layer)  # type: ignore[arg-type]
+
+        assert pebble_service.plan(layer) == PlanResult.UPDATED
+        mocked_container.add_layer.assert_called_once()
+        mocked_container.replan.assert_not_called()
+
+    def test_plan_with_changed_service(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        mocked_container.get_plan.return_value = Plan({})
+
+        assert pebble_service.plan(layer) == PlanResult.RESTARTED
+        mocked_container.add_layer.assert_called_once()
+        mocked_container.replan.assert_called_once()
+
+    def test_plan_starts_stopped_service(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        mocked_container.get_plan.return_value = Plan(layer.to_dict())  # type: ignore[arg-type]
+        mocked_container.get_service.return_value.is_running.return_value = False
+
+        assert pebble_service.plan(layer) == PlanResult.RESTARTED
+        mocked_container.add_layer.assert_not_called()
+        mocked_container.replan.assert_called_once()
+
+    def test_plan_defers_restart_without_the_lock(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        mocked_container.get_plan.return_value = Plan({})
+        mocked_container.get_service.return_value.is_running.return_value = True
+        acquire_restart = MagicMock(return_value=False)
+
+        assert pebble_service.plan(layer, acquire_restart=acquire_restart) == PlanResult.DEFERRED
+        acquire_restart.assert_called_once()
+        mocked_container.get_plan.assert_called_once()
+        mocked_container.add_layer.assert_not_called()
+        mocked_container.replan.assert_not_called()
+
+    def test_plan_drains_running_service_before_restart(
+        self,
+        pebble_service: PebbleService,
+        mocked_container: MagicMock,
+        layer: Layer,
+        mocker: MockerFixture,
+    ) -> None:
+        mocked_sleep = mocker.patch("services.time.sleep")
+        mocked_container.get_plan.return_value = Plan({})
+        mocked_container.get_service.return_value.is_running.return_value = True
+
+        assert pebble_service.plan(layer, drain_period=15) == PlanResult.RESTARTED
+        mocked_sleep.assert_called_once_with(15)
+        assert mocked_container.add_layer.call_args_list == [
+            call(WORKLOAD_CONTAINER, DRAINING_LAYER, combine=True),
+            call(WORKLOAD_CONTAINER, layer, combine=True),
+        ]
+        mocked_container.replan.assert_called_once()
+
+    def test_plan_does_not_drain_stopped_service(
+        self,
+        pebble_service: PebbleService,
+        mocked_container: MagicMock,
+        layer: Layer,
+        mocker: MockerFixture,
+    ) -> None:
+        mocked_sleep = mocker.patch("services.time.sleep")
+        mocked_container.get_plan.return_value = Plan(layer.to_dict())  # type: ignore[arg-type]
+        mocked_container.get_service.return_value.is_running.return_value = False
+
+        assert pebble_service.plan(layer, drain_period=15) == PlanResult.RESTARTED
+        mocked_sleep.assert_not_called()
+        mocked_container.add_layer.assert_not_called()
+
+    def test_plan_when_replan_failed(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        mocked_container.get_plan.return_value = Plan({})
+        mocked_container.replan.side_effect = ChangeError("error", MagicMock())
+
+        with pytest.raises(PebbleServiceError):
+            pebble_service.plan(layer)
+
+    def test_plan_when_layer_rejected(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        mocked_container.get_plan.return_value = Plan({})
+        mocked_container.add_layer.side_effect = APIError({}, 400, "Bad Request", "error")
+
+        with pytest.raises(PebbleServiceError):
+            pebble_service.plan(layer)
+        mocked_container.replan.assert_not_called()
+
+    def test_probe_with_passing_check(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        mocked_container.get_plan.return_value = Plan(layer.to_dict())  # type: ignore[arg-type]
+        mocked_container.get_checks.return_value = {
+            PEBBLE_READY_CHECK_NAME: MagicMock(status=CheckStatus.UP)
+        }
+
+        probe = pebble_service.probe(layer)
+
+        assert probe == WorkloadProbe(plan_drifted=False, service_running=True, check_up=True)
+        mocked_container.get_service.assert_not_called()
+
+    def test_probe_with_reformatted_durations(
+        self, pebble_service: PebbleService, mocked_container: MagicMock
+    ) -> None:
+        layer = pebble_service.render_pebble_layer(
+            layer_options=PebbleLayerOptions(period="60s", kill_delay="90s")
+        )
+        current_layer = layer.to_dict()
+        current_layer["services"][WORKLOAD_SERVICE]["kill-delay"] = "1m30s"
+        current_layer["checks"][PEBBLE_READY_CHECK_NAME]["period"] = "1m0s"
+        mocked_container.get_plan.return_value = Plan(current_layer)  # type: ignore[arg-type]
+        mocked_container.get_checks.return_value = {
+            PEBBLE_READY_CHECK_NAME: MagicMock(status=CheckStatus.UP)
+        }
+
+        assert not pebble_service.probe(layer).drifted
+
+    def test_probe_with_drifted_plan_and_stopped_service(
+        self, pebble_service: PebbleService, mocked_container: MagicMock, layer: Layer
+    ) -> None:
+        mocked_container.get_plan.return_value = Plan({})
+        mocked_container.get_checks.return_value = {}
+        mocked_container.get_service.return_value.is_running.return_value = False
+
+        probe = pebble_service.probe(layer)
+
+        assert probe.drifted
+        assert probe == WorkloadProbe(plan_drifted=True, service_running=False, check_up=False)